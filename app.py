@@ -1,6 +1,10 @@
 import base64
-import time
+import functools
+import io
+import json
 import re
+import string
+import html as html_mod
 import requests
 import pandas as pd
 import streamlit as st
@@ -129,58 +133,48 @@ def trigger_pages_build(owner: str, repo: str, token: str) -> bool:
 
 # --- New helpers for availability check -------------------------------
 
-def check_repo_exists(owner: str, repo: str, token: str) -> bool:
+def list_repo_root_files(owner: str, repo: str, token: str, branch: str = "main"):
+    """
+    One Git Trees API call for the root of the branch.
+    Returns the set of file names at the repo root, or None if the repo
+    does not exist. A repo without the branch yet counts as having no files.
+    """
     api_base = "https://api.github.com"
     headers = github_headers(token)
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}", headers=headers)
-    if r.status_code == 200:
-        return True
+    r = requests.get(f"{api_base}/repos/{owner}/{repo}/git/trees/{branch}", headers=headers)
     if r.status_code == 404:
-        return False
-    raise RuntimeError(f"Error checking repo: {r.status_code} {r.text}")
+        # the branch may be missing while the repo exists; ask about the repo itself.
+        # Only the status matters, so HEAD (no body); GET again just for an error message.
+        repo_api = f"{api_base}/repos/{owner}/{repo}"
+        r = requests.head(repo_api, headers=headers)
+        if r.status_code == 404:
+            return None
+        if r.status_code != 200:
+            r = requests.get(repo_api, headers=headers)
+            raise RuntimeError(f"Error checking repo: {r.status_code} {r.text}")
+        return set()
+    if r.status_code == 409:
+        return set()  # repo exists but is empty
+    if r.status_code != 200:
+        raise RuntimeError(f"Error listing repo: {r.status_code} {r.text}")
+    return {
+        item.get("path", "")
+        for item in r.json().get("tree", [])
+        if item.get("type") == "blob"
+    }
 
-def check_file_exists(owner: str, repo: str, token: str, path: str, branch: str = "main") -> bool:
-    api_base = "https://api.github.com"
-    headers = github_headers(token)
-    r = requests.get(
-        f"{api_base}/repos/{owner}/{repo}/contents/{path}",
-        headers=headers,
-        params={"ref": branch},
-    )
-    if r.status_code == 200:
-        return True
-    if r.status_code == 404:
-        return False
-    raise RuntimeError(f"Error checking file: {r.status_code} {r.text}")
+WIDGET_FILE_RE = re.compile(r"w(\d+)\.html")
 
-def find_next_widget_filename(owner: str, repo: str, token: str, branch: str = "main") -> str:
+def next_widget_filename(names) -> str:
     """
-    Look at the root of the repo and find the next available wN.html filename.
-    Returns 'w1.html' if none are found or on fallback.
+    Next free wN.html given the file names at the repo root.
     """
-    api_base = "https://api.github.com"
-    headers = github_headers(token)
-    r = requests.get(
-        f"{api_base}/repos/{owner}/{repo}/contents",
-        headers=headers,
-        params={"ref": branch},
-    )
-    if r.status_code != 200:
-        return "w1.html"
-
     max_n = 0
-    try:
-        items = r.json()
-        for item in items:
-            if item.get("type") == "file":
-                name = item.get("name", "")
-                m = re.fullmatch(r"w(\d+)\.html", name)
-                if m:
-                    max_n = max(max_n, int(m.group(1)))
-    except Exception:
-        return "w1.html"
-
-    return f"w{max_n + 1}.html" if max_n >= 0 else "w1.html"
+    for name in names:
+        m = WIDGET_FILE_RE.fullmatch(name)
+        if m:
+            max_n = max(max_n, int(m.group(1)))
+    return f"w{max_n + 1}.html"
 
 # === Brand metadata ===================================================
 
@@ -224,6 +218,15 @@ def get_brand_meta(brand: str) -> dict:
 
     return meta
 
+BRAND_NAMES = ("Action Network", "VegasInsider", "Canada Sports Betting", "RotoGrinders")
+
+@st.cache_resource
+def get_brand_meta_all() -> dict:
+    """
+    Brand name -> metadata for every brand in the picker, built once per process.
+    """
+    return {name: get_brand_meta(name) for name in BRAND_NAMES}
+
 # === 1. State -> flag URL mapping =====================================
 STATE_FLAG_URLS = {
     "Alabama": "https://commons.wikimedia.org/wiki/Special:FilePath/Flag_of_Alabama.svg",
@@ -278,13 +281,152 @@ STATE_FLAG_URLS = {
     "Wyoming": "https://commons.wikimedia.org/wiki/Special:FilePath/Flag_of_Wyoming.svg",
 }
 
+# Flag <img> markup per state, built once at import
+STATE_FLAG_IMG_HTML = {
+    state: (
+        f'<img loading="lazy" decoding="async" fetchpriority="low" alt="{html_mod.escape(state)} flag" '
+        f'width="18" height="18" src="{html_mod.escape(url)}">'
+    )
+    for state, url in STATE_FLAG_URLS.items()
+}
+
+# Rendered height of a collapsed desktop .row (8px padding x2 + 28px metric + 2px border);
+# used as the placeholder size for off-screen rows under content-visibility:auto.
+ROW_INTRINSIC_HEIGHT_PX = 46
+
 # === 2. HTML template =================================================
+
+# Styles for the viewing-factor cards (metrics grid, spark, gauge, donut, calendar).
+# They are only visible once a row is opened, so they are kept out of the
+# first-paint stylesheet and injected by the widget script on first open.
+DEFERRED_CSS = r"""
+    /* Details panel contents */
+    .vi-compact-embed .metrics-title{margin:0 0 10px;font-weight:800;font-size:14px;color:var(--brand-700)}
+    .vi-compact-embed .metrics-grid{display:grid;grid-template-columns:repeat(4,minmax(0,1fr));gap:10px}
+    @media (max-width:640px){.vi-compact-embed .metrics-grid{grid-template-columns:repeat(2,minmax(0,1fr))}}
+    /* Cards */
+    .vi-compact-embed .metric-card{
+      background:#fff;border:1px solid var(--border);border-radius:10px;padding:16px 12px 12px;
+      display:grid;grid-template-rows:auto auto var(--viz-h) auto;gap:8px;align-content:start;
+    }
+    .vi-compact-embed .metric-label{font-size:12px;color:var(--muted);font-weight:700;margin:0;line-height:1.2}
+    .vi-compact-embed .metric-number{font-weight:800;font-size:20px;color:#0e1a1f;margin:0;line-height:1.1;font-variant-numeric:tabular-nums}
+    .vi-compact-embed .metric-scale{font-size:11px;color:#8a9099;margin:0}
+
+    /* Sparkline (elevation) */
+    .vi-compact-embed .spark{align-self:center}
+    .vi-compact-embed .spark svg{width:100%;height:var(--viz-h)}
+    .vi-compact-embed .spark-base{stroke:var(--viz-soft-bg);stroke-width:3;fill:none}
+    .vi-compact-embed .spark-line{stroke:url(#az-elev-grad);stroke-width:4;fill:none;stroke-linecap:round;transition:stroke-dashoffset .6s ease}
+    .vi-compact-embed .spark-dot{fill:var(--brand-500);stroke:#fff;stroke-width:2}
+    .vi-compact-embed .donut > div{display:contents}
+    .vi-compact-embed .donut circle.bg{stroke:var(--viz-soft-bg);stroke-width:10;fill:none}
+    .vi-compact-embed .donut circle.fg{stroke:var(--brand-600);stroke-width:10;fill:none;stroke-linecap:round;transform:rotate(-90deg);transform-origin:50% 50%;transition:stroke-dashoffset .7s ease}
+
+    /* Mini bars (clear days & humidity) */
+    .vi-compact-embed .mini-bar{height:10px;border-radius:999px;background:var(--viz-soft-bar-bg);overflow:hidden;align-self:center}
+    .vi-compact-embed .mini-bar .fill{display:block;height:100%;width:0%;border-radius:999px;background:linear-gradient(90deg,var(--brand-600),var(--brand-500));transition:width .6s ease}
+
+    /* Compact defaults / shared heights */
+    .vi-compact-embed{ --viz-h:56px; --card-h:176px }
+    .vi-compact-embed .metrics-grid{ grid-auto-rows:var(--card-h); gap:10px }
+    .vi-compact-embed .metric-card{ height:100%; padding:12px 12px 10px; gap:6px; grid-template-rows:auto auto var(--viz-h) auto }
+    .vi-compact-embed .metric-number{ font-size:19px }
+    .vi-compact-embed .spark svg{ height:var(--viz-h) }
+    .vi-compact-embed .donut{ row-gap:6px }
+    .vi-compact-embed .donut svg{ width:var(--viz-h); height:var(--viz-h) }
+    .vi-compact-embed .donut circle.bg,.vi-compact-embed .donut circle.fg{ stroke-width:8 }
+    .vi-compact-embed .mini-bar{ height:8px }
+
+    /* Big ring */
+    .vi-compact-embed{ --donut-h:104px; --card-h:196px }
+    .vi-compact-embed .metric-card:has(.donut){ grid-template-rows:auto auto var(--donut-h) auto }
+    .vi-compact-embed .donut,.vi-compact-embed .donut > div{ display:contents }
+    .vi-compact-embed .donut svg{
+      grid-row:3; width:var(--donut-h); height:var(--donut-h);
+      justify-self:center !important; margin-inline:auto; display:block;
+    }
+    .vi-compact-embed .donut .metric-number{ grid-row:2 }
+    .vi-compact-embed .donut .metric-scale{ grid-row:4 }
+
+    /* Calendar viz */
+    .vi-compact-embed{ --cal-h:80px }
+    .vi-compact-embed .metric-card:has(.calendar){ grid-template-rows:auto auto var(--cal-h) auto }
+    .vi-compact-embed .calendar{
+      height:var(--cal-h); display:grid; grid-template-columns:repeat(6,1fr);
+      grid-auto-rows:1fr; gap:6px; align-self:center;
+    }
+    .vi-compact-embed .calendar .day{ border-radius:6px; background:var(--viz-soft-bg-2); position:relative; overflow:hidden }
+    .vi-compact-embed .calendar .day.filled{ background:linear-gradient(180deg,var(--brand-600),var(--brand-500)) }
+    .vi-compact-embed .calendar .day.partial::after{
+      content:""; position:absolute; inset:0; width:calc(var(--part,0)*100%);
+      background:linear-gradient(90deg,var(--brand-600),var(--brand-500));
+    }
+
+    /* Shared viz row height */
+    .vi-compact-embed{ --viz-row-h:104px }
+    .vi-compact-embed .metric-card{ grid-template-rows:auto auto var(--viz-row-h) auto !important }
+    .vi-compact-embed .metric-card:has(.donut), .vi-compact-embed .metric-card:has(.calendar){
+      grid-template-rows:auto auto var(--viz-row-h) auto !important;
+    }
+    .vi-compact-embed .spark, .vi-compact-embed .calendar, .vi-compact-embed .mini-bar{ align-self:center !important }
+    .vi-compact-embed .spark svg{ height:min(var(--viz-h,56px), calc(var(--viz-row-h) - 2px)) }
+    .vi-compact-embed .calendar{ height:var(--viz-row-h) }
+
+    /* Card layout */
+    @media (min-width:641px){
+      .vi-compact-embed .metrics-grid{ grid-template-columns: repeat(4, minmax(0,1fr)) !important; }
+    }
+    @media (max-width:640px){
+      .vi-compact-embed .metrics-grid{ grid-template-columns: repeat(2, minmax(0,1fr)) !important; }
+      .vi-compact-embed{ --card-h:188px; --viz-row-h:92px; --donut-h:92px }
+      .vi-compact-embed .calendar{ gap:5px }
+      .vi-compact-embed .metric-number{ font-size:18px }
+    }
+    @media (max-width:360px){
+      .vi-compact-embed .metrics-grid{ grid-template-columns: 1fr !important }
+    }
+
+    /* Darkness gauge (styles only) */
+    .vi-compact-embed .gauge-svg{ width:100%; height:var(--viz-row-h) }
+    .vi-compact-embed .gauge-track{ stroke:var(--viz-soft-bg); stroke-width:10; fill:none; stroke-linecap:round }
+    .vi-compact-embed .gauge-value{ stroke:url(#az-gauge-grad); stroke-width:10; fill:none; stroke-linecap:round; transition:stroke-dashoffset .7s ease }
+    .vi-compact-embed .gauge-needle{
+      transform-origin:70px 70px; transform:rotate(calc(var(--a,-90) * 1deg));
+      transition:transform .6s cubic-bezier(.2,.8,.2,1);
+    }
+    .vi-compact-embed .gauge-needle line{ stroke:var(--viz-needle-color); stroke-width:3; stroke-linecap:round }
+    .vi-compact-embed .gauge-needle circle{ fill:#fff; stroke:#cfe4da }
+
+    /* Compositor hints, only while the gauges animate (dropped on transitionend) */
+    .vi-compact-embed .details.is-animating #az-elev-line,
+    .vi-compact-embed .details.is-animating #az-dark-value,
+    .vi-compact-embed .details.is-animating #az-humid-arc{ will-change:stroke-dashoffset }
+    .vi-compact-embed .details.is-animating #az-dark-needle-group{ will-change:transform }
+
+    /* Humidity droplet */
+    .vi-compact-embed .donut .drop{
+      fill: var(--brand-600);
+      stroke: #ffffff;
+      stroke-width: 2;
+      paint-order: stroke;
+      filter: drop-shadow(0 1px 0 rgba(0,0,0,.03));
+      transform-box: fill-box;
+      transform-origin: 50% 50%;
+      transform: scale(.7);
+      vector-effect: non-scaling-stroke;
+    }
+  """
+
 HTML_TEMPLATE = r"""<!doctype html>
 <html lang="en">
 <head>
 <meta charset="utf-8" />
 <meta name="viewport" content="width=device-width, initial-scale=1" />
 <title>[[TITLE]]</title>
+<!-- Flags resolve through commons -> upload.wikimedia.org: warm both connections -->
+<link rel="preconnect" href="https://commons.wikimedia.org" />
+<link rel="preconnect" href="https://upload.wikimedia.org" />
 </head>
 
 <body style="margin:0;">
@@ -407,6 +549,10 @@ HTML_TEMPLATE = r"""<!doctype html>
       background:linear-gradient(0deg,var(--hover-tint),var(--hover-tint)),#fff!important;
       transform:scale(1.01);box-shadow:var(--hover-shadow);border-color:var(--hover-ring)!important;
     }
+    /* Skip rendering work for rows scrolled out of the .table pane */
+    @supports (content-visibility:auto){
+      .vi-compact-embed .row{content-visibility:auto;contain-intrinsic-size:auto [[ROW_INTRINSIC_H]]px}
+    }
     @media (prefers-reduced-motion:reduce){
       .vi-compact-embed .row{transition:none}
       .vi-compact-embed .row:hover,.vi-compact-embed .row:focus-within{transform:none;box-shadow:none}
@@ -428,33 +574,13 @@ HTML_TEMPLATE = r"""<!doctype html>
       background: var(--metric-bg) !important;
       overflow: hidden;
     }
-    .vi-compact-embed .bar{position:absolute;inset:0 auto 0 0;border-radius:999px;background:linear-gradient(90deg,var(--brand-600),var(--brand-500))!important;box-shadow:inset 0 0 0 1px rgba(0,0,0,.04)}
+    .vi-compact-embed .bar{position:absolute;inset:0 auto 0 0;border-radius:999px;box-shadow:inset 0 0 0 1px rgba(0,0,0,.04)}
     .vi-compact-embed .val{position:absolute;right:6px;top:50%;transform:translateY(-50%);font-variant-numeric:tabular-nums;font-weight:800;font-size:13px;color:#0e1a12!important;background:#fff!important;border:2px solid #e6e9ed!important;border-radius:999px;padding:2px 8px}
 
-    /* Gradient bars by probability band (based on implied probability) */
-    .vi-compact-embed .bar.band-very-high{
-      background: linear-gradient(90deg,var(--brand-900),var(--brand-600)) !important;
-    }  /* >=25% */
-
-    .vi-compact-embed .bar.band-high{
-      background: linear-gradient(90deg,var(--brand-700),var(--brand-500)) !important;
-    }  /* 20–<25% */
-
-    .vi-compact-embed .bar.band-mid{
-      background: linear-gradient(90deg,var(--brand-600),var(--brand-300)) !important;
-    }  /* 15–<20% */
-
-    .vi-compact-embed .bar.band-low{
-      background: linear-gradient(90deg,var(--brand-500),var(--brand-100)) !important;
-    }  /* 10–<15% */
-
-    .vi-compact-embed .bar.band-very-low{
-      background: linear-gradient(90deg,var(--brand-300),var(--brand-50)) !important;
-    }  /* 5–<10% */
-
-    .vi-compact-embed .bar.band-tiny{
-      background: linear-gradient(90deg,var(--brand-100),var(--brand-50)) !important;
-    }  /* <5% */
+    /* Gradient bars by probability band: each row sets --band-a/--band-b inline */
+    .vi-compact-embed .bar{
+      background: linear-gradient(90deg,var(--band-a,var(--brand-600)),var(--band-b,var(--brand-500))) !important;
+    }
 
     /* Details panel */
     .vi-compact-embed .details{
@@ -463,32 +589,6 @@ HTML_TEMPLATE = r"""<!doctype html>
       transition:max-height .28s ease,opacity .28s ease,transform .28s ease,padding .20s ease,margin .20s ease,border-width .20s ease;
     }
     .vi-compact-embed .details.open{margin:8px 0 12px;padding:12px;border-width:1px;max-height:420px;opacity:1;transform:translateY(0)}
-    .vi-compact-embed .metrics-title{margin:0 0 10px;font-weight:800;font-size:14px;color:var(--brand-700)}
-    .vi-compact-embed .metrics-grid{display:grid;grid-template-columns:repeat(4,minmax(0,1fr));gap:10px}
-    @media (max-width:640px){.vi-compact-embed .metrics-grid{grid-template-columns:repeat(2,minmax(0,1fr))}}
-
-    /* Cards */
-    .vi-compact-embed .metric-card{
-      background:#fff;border:1px solid var(--border);border-radius:10px;padding:16px 12px 12px;
-      display:grid;grid-template-rows:auto auto var(--viz-h) auto;gap:8px;align-content:start;
-    }
-    .vi-compact-embed .metric-label{font-size:12px;color:var(--muted);font-weight:700;margin:0;line-height:1.2}
-    .vi-compact-embed .metric-number{font-weight:800;font-size:20px;color:#0e1a1f;margin:0;line-height:1.1;font-variant-numeric:tabular-nums}
-    .vi-compact-embed .metric-scale{font-size:11px;color:#8a9099;margin:0}
-
-    /* Sparkline (elevation) */
-    .vi-compact-embed .spark{align-self:center}
-    .vi-compact-embed .spark svg{width:100%;height:var(--viz-h)}
-    .vi-compact-embed .spark-base{stroke:var(--viz-soft-bg);stroke-width:3;fill:none}
-    .vi-compact-embed .spark-line{stroke:url(#az-elev-grad);stroke-width:4;fill:none;stroke-linecap:round;transition:stroke-dashoffset .6s ease}
-    .vi-compact-embed .spark-dot{fill:var(--brand-500);stroke:#fff;stroke-width:2}
-    .vi-compact-embed .donut > div{display:contents}
-    .vi-compact-embed .donut circle.bg{stroke:var(--viz-soft-bg);stroke-width:10;fill:none}
-    .vi-compact-embed .donut circle.fg{stroke:var(--brand-600);stroke-width:10;fill:none;stroke-linecap:round;transform:rotate(-90deg);transform-origin:50% 50%;transition:stroke-dashoffset .7s ease}
-
-    /* Mini bars (clear days & humidity) */
-    .vi-compact-embed .mini-bar{height:10px;border-radius:999px;background:var(--viz-soft-bar-bg);overflow:hidden;align-self:center}
-    .vi-compact-embed .mini-bar .fill{display:block;height:100%;width:0%;border-radius:999px;background:linear-gradient(90deg,var(--brand-600),var(--brand-500));transition:width .6s ease}
 
     /* Clickable hint */
     .vi-compact-embed .row.is-clickable{cursor:pointer;position:relative}
@@ -504,68 +604,13 @@ HTML_TEMPLATE = r"""<!doctype html>
     .vi-compact-embed .details-close{margin-top:10px;align-self:flex-end;background:#fff;border:1px solid var(--border);border-radius:999px;padding:6px 10px;font-weight:700;cursor:pointer}
     .vi-compact-embed .details-close:hover{border-color:var(--hover-ring)}
 
-    /* Compact defaults / shared heights */
-    .vi-compact-embed{ --viz-h:56px; --card-h:176px }
-    .vi-compact-embed .metrics-grid{ grid-auto-rows:var(--card-h); gap:10px }
-    .vi-compact-embed .metric-card{ height:100%; padding:12px 12px 10px; gap:6px; grid-template-rows:auto auto var(--viz-h) auto }
-    .vi-compact-embed .metric-number{ font-size:19px }
-    .vi-compact-embed .spark svg{ height:var(--viz-h) }
-    .vi-compact-embed .donut{ row-gap:6px }
-    .vi-compact-embed .donut svg{ width:var(--viz-h); height:var(--viz-h) }
-    .vi-compact-embed .donut circle.bg,.vi-compact-embed .donut circle.fg{ stroke-width:8 }
-    .vi-compact-embed .mini-bar{ height:8px }
     .vi-compact-embed .details.open{ padding:8px }
 
-    /* Big ring */
-    .vi-compact-embed{ --donut-h:104px; --card-h:196px }
-    .vi-compact-embed .metric-card:has(.donut){ grid-template-rows:auto auto var(--donut-h) auto }
-    .vi-compact-embed .donut,.vi-compact-embed .donut > div{ display:contents }
-    .vi-compact-embed .donut svg{
-      grid-row:3; width:var(--donut-h); height:var(--donut-h);
-      justify-self:center !important; margin-inline:auto; display:block;
-    }
-    .vi-compact-embed .donut .metric-number{ grid-row:2 }
-    .vi-compact-embed .donut .metric-scale{ grid-row:4 }
-
-    /* Calendar viz */
-    .vi-compact-embed{ --cal-h:80px }
-    .vi-compact-embed .metric-card:has(.calendar){ grid-template-rows:auto auto var(--cal-h) auto }
-    .vi-compact-embed .calendar{
-      height:var(--cal-h); display:grid; grid-template-columns:repeat(6,1fr);
-      grid-auto-rows:1fr; gap:6px; align-self:center;
-    }
-    .vi-compact-embed .calendar .day{ border-radius:6px; background:var(--viz-soft-bg-2); position:relative; overflow:hidden }
-    .vi-compact-embed .calendar .day.filled{ background:linear-gradient(180deg,var(--brand-600),var(--brand-500)) }
-    .vi-compact-embed .calendar .day.partial::after{
-      content:""; position:absolute; inset:0; width:calc(var(--part,0)*100%);
-      background:linear-gradient(90deg,var(--brand-600),var(--brand-500));
-    }
-
-    /* Shared viz row height */
-    .vi-compact-embed{ --viz-row-h:104px }
-    .vi-compact-embed .metric-card{ grid-template-rows:auto auto var(--viz-row-h) auto !important }
-    .vi-compact-embed .metric-card:has(.donut), .vi-compact-embed .metric-card:has(.calendar){
-      grid-template-rows:auto auto var(--viz-row-h) auto !important;
-    }
-    .vi-compact-embed .spark, .vi-compact-embed .calendar, .vi-compact-embed .mini-bar{ align-self:center !important }
-    .vi-compact-embed .spark svg{ height:min(var(--viz-h,56px), calc(var(--viz-row-h) - 2px)) }
-    .vi-compact-embed .calendar{ height:var(--viz-row-h) }
-
     /* Desktop layout */
     @media (min-width:641px){
-      .vi-compact-embed .metrics-grid{ grid-template-columns: repeat(4, minmax(0,1fr)) !important; }
       .vi-compact-embed .row{ grid-template-columns: 36px 1fr minmax(240px,48%) !important; }
       .vi-compact-embed .metric{ grid-column: auto !important; }
     }
-    @media (max-width:640px){
-      .vi-compact-embed .metrics-grid{ grid-template-columns: repeat(2, minmax(0,1fr)) !important; }
-      .vi-compact-embed{ --card-h:188px; --viz-row-h:92px; --donut-h:92px }
-      .vi-compact-embed .calendar{ gap:5px }
-      .vi-compact-embed .metric-number{ font-size:18px }
-    }
-    @media (max-width:360px){
-      .vi-compact-embed .metrics-grid{ grid-template-columns: 1fr !important }
-    }
 
     /* Desktop internal scroll */
     .vi-compact-embed{ --pane-max-h: min(72vh, 680px); }
@@ -581,27 +626,6 @@ HTML_TEMPLATE = r"""<!doctype html>
     .vi-compact-embed .table::-webkit-scrollbar-thumb:hover{ background:linear-gradient(180deg,var(--brand-700),var(--brand-600)) }
     .vi-compact-embed .table{ scrollbar-width:thin; scrollbar-color:var(--brand-600) var(--brand-50) }
 
-    /* Darkness gauge (styles only) */
-    .vi-compact-embed .gauge-svg{ width:100%; height:var(--viz-row-h) }
-    .vi-compact-embed .gauge-track{ stroke:var(--viz-soft-bg); stroke-width:10; fill:none; stroke-linecap:round }
-    .vi-compact-embed .gauge-value{ stroke:url(#az-gauge-grad); stroke-width:10; fill:none; stroke-linecap:round; transition:stroke-dashoffset .7s ease }
-    .vi-compact-embed .gauge-needle{ transform-origin:70px 70px; transition:transform .6s cubic-bezier(.2,.8,.2,1) }
-    .vi-compact-embed .gauge-needle line{ stroke:var(--viz-needle-color); stroke-width:3; stroke-linecap:round }
-    .vi-compact-embed .gauge-needle circle{ fill:#fff; stroke:#cfe4da }
-
-    /* Humidity droplet */
-    .vi-compact-embed .donut .drop{
-      fill: var(--brand-600);
-      stroke: #ffffff;
-      stroke-width: 2;
-      paint-order: stroke;
-      filter: drop-shadow(0 1px 0 rgba(0,0,0,.03));
-      transform-box: fill-box;
-      transform-origin: 50% 50%;
-      transform: scale(.7);
-      vector-effect: non-scaling-stroke;
-    }
-
     /* Footer + embed button */
     .vi-compact-embed .vi-footer {
       display: block !important;
@@ -779,6 +803,8 @@ HTML_TEMPLATE = r"""<!doctype html>
     }
     /* =================== END MOBILE OVERRIDES (desktop untouched) ============== */
   </style>
+  <!-- Viewing-factor card styles: injected on first panel open -->
+  <template id="az-deferred-css"><style>[[DEFERRED_CSS]]</style></template>
 
   <div class="head">
     <h3 id="vi-compact-embed-title" class="title">[[TITLE]]</h3>
@@ -789,7 +815,8 @@ HTML_TEMPLATE = r"""<!doctype html>
   <div class="table">
     [[ROWS]]
 
-    <!-- Shared details panel -->
+    <!-- Shared details panel: stamped from the template on first row open -->
+    <template id="az-details-tpl">
     <div id="az-details" class="details" aria-hidden="true" role="region" aria-labelledby="az-metrics-title">
       <h4 id="az-metrics-title" class="metrics-title">Supermoon Viewing Factors</h4>
       <div class="metrics-grid">
@@ -867,6 +894,7 @@ HTML_TEMPLATE = r"""<!doctype html>
       </div>
       <button id="az-close" class="details-close" type="button" aria-label="Close viewing factors">Close ✕</button>
     </div>
+    </template>
   </div>
 
   <div class="vi-footer">
@@ -890,19 +918,54 @@ HTML_TEMPLATE = r"""<!doctype html>
 
   <script>
     (function(){
-      /* --- dataset for all rows (December metrics) --- */
+      /* --- dataset for all rows (December metrics) ---
+         state -> [elevation ft, darkness score, clear days, humidity %] */
       const DATA = [[DATA]];
+      const ELEV = 0, DARK = 1, CLEAR = 2, HUMID = 3;
       const DARK_MAX = 5;
 
-      const rows   = document.querySelectorAll('.vi-compact-embed .row.is-clickable[data-state]');
-      const panel  = document.getElementById('az-details');
-      const closeB = document.getElementById('az-close');
+      /* the details panel is built from its <template> on first open */
+      let panel = null;
 
       /* elevation scale uses min/max across all states */
-      const allElev = Object.values(DATA).map(d=>d.elev);
-      const elevMin = Math.min(...allElev);
-      const elevMax = Math.max(...allElev);
+      const elevMin = [[ELEV_MIN]], elevMax = [[ELEV_MAX]]; // computed by the generator
+
+      /* gauge track and humidity ring geometry is fixed in the markup: measured once
+         when the panel is first attached, so a click only touches dash offsets */
+      let darkValEl = null, humidArc = null, DARK_PATH_LEN = 0;
+      const HUMID_C = 2 * Math.PI * 26;
+
+      function initGauges(){
+        darkValEl = document.getElementById('az-dark-value');
+        humidArc  = document.getElementById('az-humid-arc');
+        DARK_PATH_LEN = darkValEl ? darkValEl.getTotalLength() : 0;
+        if(darkValEl) darkValEl.style.strokeDasharray = DARK_PATH_LEN.toFixed(1);
+        if(humidArc)  humidArc.style.strokeDasharray  = HUMID_C.toFixed(1);
+      }
+
+      let animTimer = 0;
+      function stopAnimating(){
+        clearTimeout(animTimer);
+        if(panel) panel.classList.remove('is-animating');
+      }
+
+      function getPanel(){
+        if(!panel){
+          const tpl = document.getElementById('az-details-tpl');
+          panel = document.importNode(tpl.content, true).firstElementChild;
+          const closeB = panel.querySelector('#az-close');
+          if(closeB) closeB.addEventListener('click', closePanel);
+          /* the dark gauge and humidity ring run the longest transitions (.7s) */
+          const doneAnimating = e=>{
+            if(e.target === darkValEl || e.target === humidArc) stopAnimating();
+          };
+          panel.addEventListener('transitionend', doneAnimating);
+          panel.addEventListener('transitioncancel', doneAnimating);
+        }
+        return panel;
+      }
 
+      /* write phase: spark geometry only, no layout reads */
       function drawElevationSpark(val){
         const base = document.querySelector('#az-elev-spark .spark-base');
         const line = document.getElementById('az-elev-line');
@@ -917,73 +980,95 @@ HTML_TEMPLATE = r"""<!doctype html>
         line.setAttribute('d', `M${x0},${baselineY} L${x1},${yEnd.toFixed(2)}`);
         dot.setAttribute('cx', x1);
         dot.setAttribute('cy', yEnd.toFixed(2));
+      }
 
-        const L = line.getTotalLength();
-        line.style.strokeDasharray = L;
-        line.style.strokeDashoffset = L;
-        requestAnimationFrame(()=>{ line.style.strokeDashoffset = 0; });
+      /* read phase: only the spark line changes length per state */
+      function measureSpark(){
+        const line = document.getElementById('az-elev-line');
+        return line ? line.getTotalLength() : 0;
       }
 
-      function drawDarknessGauge(val){
-        const gVal    = document.getElementById('az-dark-value');
+      /* write phase: reset dashes to empty, then animate to the targets next frame */
+      function animateGauges(d, sparkLen){
+        const line    = document.getElementById('az-elev-line');
         const gNeedle = document.getElementById('az-dark-needle-group');
-        if(!gVal || !gNeedle) return;
-
-        const len = gVal.getTotalLength();
-        gVal.style.strokeDasharray = len.toFixed(1);
-        gVal.style.strokeDashoffset = len.toFixed(1);
-
-        const pct = Math.max(0, Math.min(1, val / DARK_MAX));
+        const darkPct  = Math.max(0, Math.min(1, d[DARK] / DARK_MAX));
+        const humidPct = Math.max(0, Math.min(1, d[HUMID] / 100));
+
+        if(line){ line.style.strokeDasharray = sparkLen; line.style.strokeDashoffset = sparkLen; }
+        if(darkValEl) darkValEl.style.strokeDashoffset = DARK_PATH_LEN.toFixed(1);
+        if(humidArc)  humidArc.style.strokeDashoffset  = HUMID_C.toFixed(1);
+
+        if(panel){
+          panel.classList.add('is-animating');
+          /* no transition fires when the values don't change or motion is reduced */
+          clearTimeout(animTimer);
+          animTimer = setTimeout(stopAnimating, 1000);
+        }
         requestAnimationFrame(()=>{
-          gVal.style.strokeDashoffset = (len * (1 - pct)).toFixed(1);
-          const angle = -90 + 180 * pct;
-          gNeedle.style.transform = `rotate(${angle}deg)`;
+          if(line) line.style.strokeDashoffset = 0;
+          if(darkValEl) darkValEl.style.strokeDashoffset = (DARK_PATH_LEN * (1 - darkPct)).toFixed(1);
+          if(gNeedle) gNeedle.style.setProperty('--a', (-90 + 180 * darkPct).toFixed(1));
+          if(humidArc) humidArc.style.strokeDashoffset = (HUMID_C * (1 - humidPct)).toFixed(1);
         });
       }
 
-      function drawHumidityRing(pctVal){
-        const arc = document.getElementById('az-humid-arc');
-        if(!arc) return;
-        const r=26, C=2*Math.PI*r;
-        arc.style.strokeDasharray = C.toFixed(1);
-        arc.style.strokeDashoffset = C.toFixed(1);
-        const pct = Math.max(0, Math.min(1, pctVal/100));
-        requestAnimationFrame(()=> arc.style.strokeDashoffset = (C*(1-pct)).toFixed(1));
-      }
+      const DAY_FILLED = '<span class="day filled"></span>';
+      const DAY_EMPTY  = '<span class="day"></span>';
 
       function buildCalendar(days){
         const cal = document.getElementById('az-clear-cal');
         if(!cal) return;
-        cal.innerHTML = '';
         const total = 31;
-        const whole = Math.floor(days);
+        const whole = Math.max(0, Math.min(total, Math.floor(days)));
         const frac  = Math.max(0, Math.min(1, days - whole));
-        for(let i=0;i<total;i++){
-          const cell=document.createElement('span');
-          cell.className='day';
-          if(i<whole) cell.classList.add('filled');
-          else if(i===whole && frac>0){ cell.classList.add('partial'); cell.style.setProperty('--part', frac.toFixed(2)); }
-          cal.appendChild(cell);
+        let html = DAY_FILLED.repeat(whole);
+        let rest = total - whole;
+        if(rest > 0 && frac > 0){
+          html += `<span class="day partial" style="--part:${frac.toFixed(2)}"></span>`;
+          rest--;
         }
+        cal.innerHTML = html + DAY_EMPTY.repeat(rest); // one parse + one insertion
       }
 
       function renderState(name){
         const d = DATA[name]; if(!d) return;
         const title = document.getElementById('az-metrics-title'); if(title) title.textContent = name+' \u2014 Supermoon Viewing Factors';
-        const ez = document.getElementById('az-elev-val');   if(ez) ez.textContent = d.elev.toLocaleString()+' ft';
-        const dz = document.getElementById('az-dark-val');   if(dz) dz.textContent = d.dark.toFixed(2)+' / 5';
-        const cz = document.getElementById('az-clear-val');  if(cz) cz.textContent = d.clear.toFixed(1)+' days';
-        const hz = document.getElementById('az-humid-val');  if(hz) hz.textContent = Math.round(d.humid)+'%';
-
-        drawElevationSpark(d.elev);
-        drawDarknessGauge(d.dark);
-        drawHumidityRing(d.humid);
-        buildCalendar(d.clear);
+        /* blank source cells arrive as null */
+        const show = (v, f) => v == null ? '\u2014' : f(v);
+        const ez = document.getElementById('az-elev-val');   if(ez) ez.textContent = show(d[ELEV], v=>v.toLocaleString()+' ft');
+        const dz = document.getElementById('az-dark-val');   if(dz) dz.textContent = show(d[DARK], v=>v.toFixed(2)+' / 5');
+        const cz = document.getElementById('az-clear-val');  if(cz) cz.textContent = show(d[CLEAR], v=>v.toFixed(1)+' days');
+        const hz = document.getElementById('az-humid-val');  if(hz) hz.textContent = show(d[HUMID], v=>Math.round(v)+'%');
+
+        drawElevationSpark(d[ELEV] ?? elevMin);
+        buildCalendar(d[CLEAR] ?? 0);
+
+        /* read phase after every write above: spark length + panel position */
+        requestAnimationFrame(()=>{
+          const sparkLen = measureSpark();
+          const rect = panel.getBoundingClientRect();
+          animateGauges(d, sparkLen);
+          if (rect.top < 0 || rect.bottom > window.innerHeight) {
+            panel.scrollIntoView({block:'nearest', behavior:'smooth'});
+          }
+        });
+      }
+
+      let deferredCssLoaded = false;
+      function loadDeferredCss(){
+        if (deferredCssLoaded) return;
+        deferredCssLoaded = true;
+        const tpl = document.getElementById('az-deferred-css');
+        if (tpl) tpl.after(tpl.content.cloneNode(true));
       }
 
       function openUnderRow(row){
+        loadDeferredCss();
         const state = row.dataset.state;
-        row.after(panel); // move shared panel under row
+        const firstOpen = !panel;
+        row.after(getPanel()); // move shared panel under row
+        if(firstOpen) initGauges();
         document.querySelectorAll('.vi-compact-embed .row.is-clickable[aria-expanded]')
           .forEach(r=>r.setAttribute('aria-expanded','false'));
         row.setAttribute('aria-expanded','true');
@@ -993,49 +1078,68 @@ HTML_TEMPLATE = r"""<!doctype html>
           panel.setAttribute('aria-hidden','false');
         }
         renderState(state);
-        panel.scrollIntoView({block:'nearest', behavior:'smooth'});
       }
 
       function closePanel(){
-        panel.classList.remove('open');
+        if(!panel) return;
+        panel.classList.remove('open', 'is-animating');
         panel.setAttribute('aria-hidden','true');
         document.querySelectorAll('.vi-compact-embed .row.is-clickable[aria-expanded]')
           .forEach(r=>r.setAttribute('aria-expanded','false'));
       }
 
-      rows.forEach(row=>{
-        row.addEventListener('click', ()=>{
-          const isExpanded  = row.getAttribute('aria-expanded') === 'true';
-          const panelIsOpen = panel.classList.contains('open');
-          if (isExpanded && panelIsOpen) closePanel();
-          else openUnderRow(row);
-        });
+      function toggleRow(row){
+        const isExpanded  = row.getAttribute('aria-expanded') === 'true';
+        const panelIsOpen = !!panel && panel.classList.contains('open');
+        if (isExpanded && panelIsOpen) closePanel();
+        else openUnderRow(row);
+      }
 
-        row.addEventListener('keydown', e=>{
-          if(e.key==='Enter' || e.key===' '){
-            e.preventDefault();
-            const isExpanded  = row.getAttribute('aria-expanded') === 'true';
-            const panelIsOpen = panel.classList.contains('open');
-            if (isExpanded && panelIsOpen) closePanel();
-            else openUnderRow(row);
-          }
+      /* one delegated listener pair on the table instead of two per row */
+      const ROW_SELECTOR = '.row.is-clickable[data-state]';
+      const table = document.querySelector('.vi-compact-embed .table');
+      if (table) {
+        table.addEventListener('click', e=>{
+          const row = e.target.closest(ROW_SELECTOR);
+          if (row) toggleRow(row);
         });
-      });
+        table.addEventListener('keydown', e=>{
+          if (e.key !== 'Enter' && e.key !== ' ') return;
+          const row = e.target.closest(ROW_SELECTOR);
+          if (!row) return;
+          e.preventDefault();
+          toggleRow(row);
+        });
+      }
 
-      if(closeB) closeB.addEventListener('click', closePanel);
-      document.addEventListener('keydown', e=>{ if(e.key==='Escape' && panel.classList.contains('open')) closePanel(); });
+      document.addEventListener('keydown', e=>{ if(e.key==='Escape' && panel && panel.classList.contains('open')) closePanel(); });
 
       /* ---- Auto-resize messaging to parent (iframe) ---- */
+      let lastHeight = -1;
       function sendHeightToParent() {
         try {
           const height = document.body.scrollHeight;
+          if (height === lastHeight) return; // nothing changed, skip the postMessage
+          lastHeight = height;
           window.parent.postMessage({ type: "resize-iframe", height: height, src: window.location.href }, "*");
         } catch (e) {}
       }
-      window.addEventListener("load", sendHeightToParent);
-      window.addEventListener("resize", sendHeightToParent);
-      const observer = new MutationObserver(sendHeightToParent);
-      observer.observe(document.body, { childList: true, subtree: true, attributes: true });
+      /* coalesce every trigger into one layout read + postMessage per idle window */
+      let heightScheduled = false;
+      function scheduleHeight() {
+        if (heightScheduled) return;
+        heightScheduled = true;
+        const cb = () => { heightScheduled = false; sendHeightToParent(); };
+        if (window.requestIdleCallback) requestIdleCallback(cb, { timeout: 100 });
+        else requestAnimationFrame(cb);
+      }
+      window.addEventListener("load", scheduleHeight);
+      window.addEventListener("resize", scheduleHeight);
+      if ('ResizeObserver' in window) {
+        new ResizeObserver(scheduleHeight).observe(document.documentElement);
+      } else {
+        new MutationObserver(scheduleHeight).observe(document.body, { childList: true, subtree: true });
+      }
 
       /* ---- Embed button copy behavior ---- */
       const btn     = document.getElementById('copy-embed-btn');
@@ -1044,42 +1148,45 @@ HTML_TEMPLATE = r"""<!doctype html>
       const status  = document.getElementById('copy-status');
 
       if (btn && ta && wrapper && status) {
-        btn.addEventListener('click', () => {
+        // Outside-click / Esc handlers are attached only while the popup is open
+        function onOutsideClick(e){
+          if (!wrapper.contains(e.target) && !btn.contains(e.target)) closePopup(false);
+        }
+        function onPopupKeydown(e){
+          if (e.key === 'Escape') closePopup(true);
+        }
+
+        function openPopup(){
+          wrapper.style.display = 'block';
+          btn.textContent = 'Hide Embed Code';
+          btn.setAttribute('aria-expanded', 'true');
+          ta.focus();
+          ta.select();
+          try { document.execCommand('copy'); } catch(e) {}
+          status.style.display = 'block';
+          setTimeout(() => status.style.display = 'none', 2500);
+          document.addEventListener('click', onOutsideClick);
+          document.addEventListener('keydown', onPopupKeydown);
+          scheduleHeight();
+        }
+
+        function closePopup(refocus){
+          wrapper.style.display = 'none';
+          btn.setAttribute('aria-expanded','false');
+          btn.textContent = '\ud83d\udd17 Embed This Table';
+          document.removeEventListener('click', onOutsideClick);
+          document.removeEventListener('keydown', onPopupKeydown);
+          if (refocus) btn.focus();
+          scheduleHeight();
+        }
+
+        btn.addEventListener('click', (e) => {
           const isHidden = wrapper.style.display === 'none' || wrapper.style.display === '';
-          wrapper.style.display = isHidden ? 'block' : 'none';
-          btn.textContent = isHidden ? 'Hide Embed Code' : '\ud83d\udd17 Embed This Table';
-          btn.setAttribute('aria-expanded', String(isHidden));
           if (isHidden) {
-            ta.focus();
-            ta.select();
-            try { document.execCommand('copy'); } catch(e) {}
-            status.style.display = 'block';
-            setTimeout(() => status.style.display = 'none', 2500);
+            e.stopPropagation(); // don't let this click reach the outside-click handler
+            openPopup();
           } else {
-            btn.focus();
-          }
-          sendHeightToParent();
-        });
-
-        // Close when clicking outside the popup
-        document.addEventListener('click', (e)=>{
-          const open = wrapper.style.display === 'block';
-          if (open && !wrapper.contains(e.target) && !btn.contains(e.target)) {
-            wrapper.style.display = 'none';
-            btn.setAttribute('aria-expanded','false');
-            btn.textContent = '\ud83d\udd17 Embed This Table';
-            sendHeightToParent();
-          }
-        });
-
-        // Close on Esc when popup is open
-        document.addEventListener('keydown', (e)=>{
-          if (e.key === 'Escape' && wrapper.style.display === 'block') {
-            wrapper.style.display = 'none';
-            btn.setAttribute('aria-expanded','false');
-            btn.textContent = '\ud83d\udd17 Embed This Table';
-            btn.focus();
-            sendHeightToParent();
+            closePopup(true);
           }
         });
       }
@@ -1091,6 +1198,39 @@ HTML_TEMPLATE = r"""<!doctype html>
 """
 
 # === 3. Generator: build rows + DATA ==================================
+
+# HTML_TEMPLATE compiled once at import: literal "$" (JS template literals) is
+# escaped, then every [[TOKEN]] becomes a ${TOKEN} substitution slot.
+HTML_TEMPLATE_COMPILED = string.Template(
+    HTML_TEMPLATE.replace("$", "$$").replace("[[", "${").replace("]]", "}")
+)
+
+
+@functools.lru_cache(maxsize=64)
+def escape_html_text(text: str) -> str:
+    """HTML-escape user-facing text once per distinct value."""
+    return html_mod.escape(text or "")
+
+
+# Implied-probability band edges (lower bound inclusive) and the inline
+# custom properties that pick each band's gradient stops from the brand palette
+PROB_BAND_EDGES = [float("-inf"), 5.0, 10.0, 15.0, 20.0, 25.0, float("inf")]
+PROB_BAND_STYLES = [
+    "--band-a:var(--brand-100);--band-b:var(--brand-50);",   # <5%
+    "--band-a:var(--brand-300);--band-b:var(--brand-50);",   # 5–<10%
+    "--band-a:var(--brand-500);--band-b:var(--brand-100);",  # 10–<15%
+    "--band-a:var(--brand-600);--band-b:var(--brand-300);",  # 15–<20%
+    "--band-a:var(--brand-700);--band-b:var(--brand-500);",  # 20–<25%
+    "--band-a:var(--brand-900);--band-b:var(--brand-600);",  # >=25%
+]
+
+# Pure function of its inputs: memoized across reruns (title keystrokes, radio
+# toggles) with a cheap content hash for the DataFrame
+@st.cache_data(
+    max_entries=32,
+    show_spinner=False,
+    hash_funcs={pd.DataFrame: lambda d: pd.util.hash_pandas_object(d, index=True).values.tobytes()},
+)
 def generate_html_from_df(
     df: pd.DataFrame,
     title: str,
@@ -1106,83 +1246,125 @@ def generate_html_from_df(
 
     max_prob = float(df["probability"].max() or 1.0)
 
-    def band_for_prob(prob: float) -> str:
-        """Map implied probability to a color band class."""
-        if prob >= 25.0:
-            return "band-very-high"
-        elif prob >= 20.0:
-            return "band-high"
-        elif prob >= 15.0:
-            return "band-mid"
-        elif prob >= 10.0:
-            return "band-low"
-        elif prob >= 5.0:
-            return "band-very-low"
-        else:
-            return "band-tiny"
-
-    row_snippets = []
-    for _, row in df.iterrows():
-        state = str(row["state"])
-        rank = int(row["rank"])
-        prob = float(row["probability"])
-        odds = int(row["odds"])
-
-        width_pct = prob / max_prob * 100.0
-        bar_style = f"width:{width_pct:.2f}%;"
-        band_class = band_for_prob(prob)
-
-        flag_url = STATE_FLAG_URLS.get(state, "")
-        if flag_url:
-            img_html = (
-                f'<img loading="lazy" decoding="async" alt="{state} flag" '
-                f'width="18" height="18" src="{flag_url}">'
-            )
-        else:
-            img_html = ""
-
-        row_html = f"""
-    <div class="row is-clickable" data-state="{state}" data-rank="{rank}" aria-expanded="false" tabindex="0" role="button">
-      <div class="rank">{rank}</div>
-      <div class="state">
-        <span class="chip">{img_html}</span>
-        {state}
-      </div>
-      <div class="metric">
-        <span class="bar {band_class}" style="{bar_style}"></span>
-        <span class="val">{prob:.2f}% (+{odds})</span>
-      </div>
-    </div>""".rstrip()
-        row_snippets.append(row_html)
-
-    rows_html = "\n\n".join(row_snippets)
-
-    data_lines = []
-    for _, row in df.iterrows():
-        state = str(row["state"])
-        elev = float(row["elevation_ft"])
-        dark = float(row["dark_score"])
-        clear_days = float(row["clear_days_dec"])
-        humid = float(row["humidity_dec"])
-        data_lines.append(
-            f'        "{state}":  {{ elev:{elev}, dark:{dark:.2f}, clear:{clear_days:.2f}, humid:{humid:.2f} }}'
+    # Map implied probability to its band gradient in one vectorized pass
+    df["band"] = (
+        pd.cut(
+            df["probability"],
+            bins=PROB_BAND_EDGES,
+            labels=PROB_BAND_STYLES,
+            right=False,
         )
-    data_js = "{\n" + ",\n".join(data_lines) + "\n      }"
-
-    html = (
-        HTML_TEMPLATE
-        .replace("[[ROWS]]", rows_html)
-        .replace("[[DATA]]", data_js)
-        .replace("[[TITLE]]", title)
-        .replace("[[SUBTITLE]]", subtitle)
-        .replace("[[EMBED_URL]]", embed_url)
-        .replace("[[BRAND_LOGO_URL]]", brand_logo_url)
-        .replace("[[BRAND_LOGO_ALT]]", brand_logo_alt)
-        .replace("[[BRAND_CLASS]]", brand_class or "")
+        .astype(object)
+        .fillna(PROB_BAND_STYLES[0])
+    )
+    df["width_pct"] = df["probability"] / max_prob * 100.0
+
+    # Row markup assembled column-wise with pandas string concatenation
+    state = df["state"].astype(str)
+    state_html = state.map(escape_html_text).astype(str)
+    rank = df["rank"].astype(str)
+    rows = (
+        '\n    <div class="row is-clickable" data-state="' + state_html + '" data-rank="' + rank
+        + '" aria-expanded="false" tabindex="0" role="button">'
+        + '\n      <div class="rank">' + rank + '</div>'
+        + '\n      <div class="state">\n        <span class="chip">'
+        + state.map(STATE_FLAG_IMG_HTML).fillna("").astype(str)
+        + '</span>\n        ' + state_html + '\n      </div>'
+        + '\n      <div class="metric">'
+        + '\n        <span class="bar" style="' + df["band"].astype(str) + 'width:' + df["width_pct"].map("{:.2f}".format).astype(str) + '%;"></span>'
+        + '\n        <span class="val">' + df["probability"].map("{:.2f}".format).astype(str) + '% (+' + df["odds"].astype(str) + ')</span>'
+        + '\n      </div>\n    </div>'
     )
+    rows_html = "\n\n".join(rows.tolist())
+
+    # DATA ships as compact JSON arrays (state -> [elev, dark, clear, humid]),
+    # parsed with JSON.parse in the widget; key order matches the JS index constants.
+    # Blank cells go out as null (JSON has no NaN); the widget shows a dash.
+    def metric(x, ndigits):
+        return None if pd.isna(x) else round(x, ndigits)
+
+    data_dict = {
+        state: [
+            None if pd.isna(elev) else int(round(elev)),
+            metric(dark, 2),
+            metric(clear_days, 2),
+            metric(humid, 2),
+        ]
+        for state, elev, dark, clear_days, humid in zip(
+            df["state"].astype(str).tolist(),
+            df["elevation_ft"].astype(float).tolist(),
+            df["dark_score"].astype(float).tolist(),
+            df["clear_days_dec"].astype(float).tolist(),
+            df["humidity_dec"].astype(float).tolist(),
+        )
+    }
+    data_json = json.dumps(data_dict, separators=(",", ":"))
+    elevs = [row[0] for row in data_dict.values() if row[0] is not None]
+    elev_min = min(elevs, default=0)
+    elev_max = max(elevs, default=0)
+    data_js = "JSON.parse(" + json.dumps(data_json).replace("</", "<\\/") + ")"
+
+    values = {
+        "ROWS": rows_html,
+        "DATA": data_js,
+        "TITLE": escape_html_text(title),
+        "SUBTITLE": escape_html_text(subtitle),
+        "EMBED_URL": escape_html_text(embed_url),
+        "BRAND_LOGO_URL": escape_html_text(brand_logo_url),
+        "BRAND_LOGO_ALT": escape_html_text(brand_logo_alt),
+        "BRAND_CLASS": brand_class or "",
+        "ROW_INTRINSIC_H": str(ROW_INTRINSIC_HEIGHT_PX),
+        "ELEV_MIN": str(elev_min),
+        "ELEV_MAX": str(elev_max),
+        "DEFERRED_CSS": DEFERRED_CSS,
+    }
+
+    html = HTML_TEMPLATE_COMPILED.safe_substitute(values)
 
     return html
 
+# === 4. CSV loading ==================================================
+
+REQUIRED_COLS = [
+    "State",
+    "Implied Supermoon Viewing Probability (%)",
+    "Supermoon Viewing Odds (Moneyline)",
+    "Avg. Clear Sky Days (Dec)",
+    "Avg. Humidity (Dec)",
+    "Avg. Elevation (ft)",
+    "Darkness Score (1–5)",
+]
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def read_uploaded_csv(csv_bytes: bytes) -> pd.DataFrame:
+    """Parse the uploaded CSV once per distinct file instead of on every rerun."""
+    return pd.read_csv(io.BytesIO(csv_bytes))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def clean_supermoon_df(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """Map the CSV columns onto the generator's column names and types."""
+    df = pd.DataFrame()
+    df["state"] = raw_df["State"]
+    df["probability"] = (
+        raw_df["Implied Supermoon Viewing Probability (%)"]
+        .astype(str)
+        .str.replace("%", "", regex=False)
+        .str.strip()
+        .astype(float)
+    )
+    df["odds"] = (
+        raw_df["Supermoon Viewing Odds (Moneyline)"]
+        .astype(str)
+        .str.replace("+", "", regex=False)
+        .str.strip()
+        .astype(int)
+    )
+    df["clear_days_dec"] = raw_df["Avg. Clear Sky Days (Dec)"].astype(float)
+    df["humidity_dec"] = raw_df["Avg. Humidity (Dec)"].astype(float)
+    df["elevation_ft"] = raw_df["Avg. Elevation (ft)"].astype(float)
+    df["dark_score"] = raw_df["Darkness Score (1–5)"].astype(float)
+    return df
+
 # === 5. Streamlit App ================================================
 
 st.set_page_config(page_title="Supermoon Table Generator", layout="wide")
@@ -1193,13 +1375,108 @@ st.write(
     "to publish your Supermoon table via GitHub Pages."
 )
 
+# ---------- Embed URL ----------
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def compute_expected_embed_url(user: str, repo: str, fname: str) -> str:
+    if user and repo.strip():
+        return f"https://{user}.github.io/{repo.strip()}/{fname}"
+    return "https://example.github.io/your-repo/widget.html"
+
+def current_embed_url(user: str, repo: str, fname: str) -> str:
+    """
+    Embed URL for the current inputs; only rebuilt when they change.
+    """
+    key = (user, repo, fname)
+    if st.session_state.get("embed_url_key") != key:
+        st.session_state["expected_embed_url"] = compute_expected_embed_url(*key)
+        st.session_state["embed_url_key"] = key
+    return st.session_state["expected_embed_url"]
+
+# ---------- Availability probe ----------
+
+@st.cache_data(ttl=30, show_spinner=False)
+def probe_availability(user: str, repo: str, base_filename: str) -> dict:
+    """
+    Repo / file availability for a campaign, cached for 30s so repeated
+    checks don't hit GitHub again.
+    """
+    # one tree listing answers repo / file / next-name together
+    root_files = list_repo_root_files(user, repo, GITHUB_TOKEN)
+    repo_exists = root_files is not None
+    file_exists = repo_exists and base_filename in root_files
+    return {
+        "repo_exists": repo_exists,
+        "file_exists": file_exists,
+        "checked_filename": base_filename,
+        "suggested_new_filename": next_widget_filename(root_files) if file_exists else None,
+    }
+
+# ---------- Availability result + options ----------
+
+@st.fragment
+def render_availability(base_filename: str) -> None:
+    """
+    Show the last availability check and the file-conflict choice.
+    Runs as a fragment so toggling the radio only reruns this block; a full
+    rerun is requested only when the chosen file name actually changes.
+    """
+    availability = st.session_state.get("availability")
+    if not availability:
+        return
+
+    previous_file_name = st.session_state.get("widget_file_name")
+    repo_exists = availability.get("repo_exists", False)
+    file_exists = availability.get("file_exists", False)
+    checked_filename = availability.get("checked_filename", base_filename)
+    suggested_new_filename = availability.get("suggested_new_filename") or "w1.html"
+
+    if not repo_exists:
+        st.info(
+            "No existing repo found for this campaign. "
+            "When you click **Update widget**, the repo will be created and "
+            f"your widget will be saved as `{checked_filename}`."
+        )
+        st.session_state["widget_file_name"] = checked_filename
+    elif repo_exists and not file_exists:
+        st.success(
+            f"Repo exists and `{checked_filename}` is available. "
+            "Update widget will save your table to this file."
+        )
+        st.session_state["widget_file_name"] = checked_filename
+    else:
+        st.warning(
+            f"A page named `{checked_filename}` already exists in this repo."
+        )
+        choice = st.radio(
+            "What would you like to do?",
+            options=[
+                "Replace existing widget (overwrite file)",
+                f"Create additional widget file in same repo (use {suggested_new_filename})",
+                "Change campaign name instead",
+            ],
+            key="file_conflict_choice",
+        )
+        if choice.startswith("Replace"):
+            st.session_state["widget_file_name"] = checked_filename
+            st.info(f"Update widget will overwrite `{checked_filename}` in this repo.")
+        elif choice.startswith("Create additional"):
+            st.session_state["widget_file_name"] = suggested_new_filename
+            st.info(
+                f"Update widget will create a new file `{suggested_new_filename}` "
+                "in the same repo for this widget."
+            )
+        else:
+            st.info(
+                "Update the campaign name above, then run **Page availability check** again."
+            )
+
+    # the embed URL caption and preview depend on the file name
+    if st.session_state.get("widget_file_name") != previous_file_name:
+        st.rerun()
+
 # ---------- Brand selection (moved to top, before CSV upload) ----------
-brand_options = [
-    "Action Network",
-    "VegasInsider",
-    "Canada Sports Betting",
-    "RotoGrinders",
-]
+brand_options = list(BRAND_NAMES)
 default_brand = st.session_state.get("brand", "Action Network")
 if default_brand not in brand_options:
     default_brand = "Action Network"
@@ -1214,47 +1491,22 @@ brand = st.selectbox(
 uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
 
 if uploaded_file is not None:
-    # --- Step 1: read & clean CSV ---
+    # reads go through this short alias; writes stay on st.session_state[...]
+    ss = st.session_state
+
+    # --- Step 1: read & clean CSV (parsed once per distinct upload) ---
     try:
-        raw_df = pd.read_csv(uploaded_file)
+        raw_df = read_uploaded_csv(uploaded_file.getvalue())
     except Exception as e:
         st.error(f"Error reading CSV: {e}")
         st.stop()
 
-    required_cols = [
-        "State",
-        "Implied Supermoon Viewing Probability (%)",
-        "Supermoon Viewing Odds (Moneyline)",
-        "Avg. Clear Sky Days (Dec)",
-        "Avg. Humidity (Dec)",
-        "Avg. Elevation (ft)",
-        "Darkness Score (1–5)",
-    ]
-    missing = [c for c in required_cols if c not in raw_df.columns]
+    missing = [c for c in REQUIRED_COLS if c not in raw_df.columns]
     if missing:
         st.error(f"Missing required columns in CSV: {missing}")
         st.stop()
 
-    df = pd.DataFrame()
-    df["state"] = raw_df["State"]
-    df["probability"] = (
-        raw_df["Implied Supermoon Viewing Probability (%)"]
-        .astype(str)
-        .str.replace("%", "", regex=False)
-        .str.strip()
-        .astype(float)
-    )
-    df["odds"] = (
-        raw_df["Supermoon Viewing Odds (Moneyline)"]
-        .astype(str)
-        .str.replace("+", "", regex=False)
-        .str.strip()
-        .astype(int)
-    )
-    df["clear_days_dec"] = raw_df["Avg. Clear Sky Days (Dec)"].astype(float)
-    df["humidity_dec"] = raw_df["Avg. Humidity (Dec)"].astype(float)
-    df["elevation_ft"] = raw_df["Avg. Elevation (ft)"].astype(float)
-    df["dark_score"] = raw_df["Darkness Score (1–5)"].astype(float)
+    df = clean_supermoon_df(raw_df)
 
     # Defaults for widget text (2026, all 50 states ranked best→worst)
     default_title = "Supermoon Viewing in 2026: Ranking All 50 U.S. States"
@@ -1264,8 +1516,8 @@ if uploaded_file is not None:
     )
 
     # ---------- GitHub / hosting settings ----------
-    saved_gh_user = st.session_state.get("gh_user", "")
-    saved_gh_repo = st.session_state.get("gh_repo", "supermoon-visibility-widget")
+    saved_gh_user = ss.get("gh_user", "")
+    saved_gh_repo = ss.get("gh_repo", "supermoon-visibility-widget")
 
     username_options = ["GauthamBC", "ActionNetwork", "MoonWatcher", "SampleUser"]
     if GITHUB_USER_DEFAULT and GITHUB_USER_DEFAULT not in username_options:
@@ -1291,14 +1543,9 @@ if uploaded_file is not None:
     )
 
     base_filename = "supermoon_table.html"
-    widget_file_name = st.session_state.get("widget_file_name", base_filename)
-
-    def compute_expected_embed_url(user: str, repo: str, fname: str) -> str:
-        if user and repo.strip():
-            return f"https://{user}.github.io/{repo.strip()}/{fname}"
-        return "https://example.github.io/your-repo/widget.html"
+    widget_file_name = ss.get("widget_file_name", base_filename)
 
-    expected_embed_url = compute_expected_embed_url(
+    expected_embed_url = current_embed_url(
         effective_github_user, repo_name, widget_file_name
     )
 
@@ -1314,8 +1561,6 @@ if uploaded_file is not None:
         unsafe_allow_html=True,
     )
 
-    iframe_snippet = st.session_state.get("iframe_snippet")
-
     # ---------- Button row: Page availability check & Update widget ----------
     col_check, col_get = st.columns([1, 1])
 
@@ -1331,35 +1576,17 @@ if uploaded_file is not None:
     else:
         # --- Page availability check button ---
         with col_check:
-            if st.button("Page availability check"):
+            check_clicked = st.button("Page availability check")
+            refresh_clicked = st.button("Force refresh", help="Ignore the cached check and ask GitHub again")
+            if check_clicked or refresh_clicked:
                 try:
-                    repo_exists = check_repo_exists(
+                    if refresh_clicked:
+                        probe_availability.clear()
+                    st.session_state["availability"] = probe_availability(
                         effective_github_user,
                         repo_name.strip(),
-                        GITHUB_TOKEN,
+                        base_filename,
                     )
-                    file_exists = False
-                    next_fname = None
-                    if repo_exists:
-                        file_exists = check_file_exists(
-                            effective_github_user,
-                            repo_name.strip(),
-                            GITHUB_TOKEN,
-                            base_filename,
-                        )
-                        if file_exists:
-                            next_fname = find_next_widget_filename(
-                                effective_github_user,
-                                repo_name.strip(),
-                                GITHUB_TOKEN,
-                            )
-
-                    st.session_state["availability"] = {
-                        "repo_exists": repo_exists,
-                        "file_exists": file_exists,
-                        "checked_filename": base_filename,
-                        "suggested_new_filename": next_fname,
-                    }
                     # default to base file name unless user chooses otherwise
                     st.session_state.setdefault("widget_file_name", base_filename)
 
@@ -1369,189 +1596,132 @@ if uploaded_file is not None:
         # --- Update widget button (publishes to GitHub) ---
         with col_get:
             if st.button("Update widget"):
-                try:
-                    # Progress bar placeholder
-                    progress_placeholder = st.empty()
-                    progress = progress_placeholder.progress(0)
-
-                    for pct in (20, 45, 70):
-                        time.sleep(0.12)
-                        progress.progress(pct)
-
-                    title_for_publish = st.session_state.get("widget_title", default_title)
-                    subtitle_for_publish = st.session_state.get("widget_subtitle", default_subtitle)
-                    brand_for_publish = st.session_state.get("brand", brand)
-                    brand_meta_publish = get_brand_meta(brand_for_publish)
-
-                    # Use current chosen filename
-                    widget_file_name = st.session_state.get("widget_file_name", base_filename)
-                    expected_embed_url = compute_expected_embed_url(
-                        effective_github_user, repo_name, widget_file_name
-                    )
-
-                    # Generate final HTML with the real embed URL
-                    html_final = generate_html_from_df(
-                        df,
-                        title_for_publish,
-                        subtitle_for_publish,
-                        expected_embed_url,
-                        brand_meta_publish["logo_url"],
-                        brand_meta_publish["logo_alt"],
-                        brand_meta_publish["brand_class"],
-                    )
+                with st.status("Publishing widget...", expanded=False) as status:
+                    try:
+                        title_for_publish = ss.get("widget_title", default_title)
+                        subtitle_for_publish = ss.get("widget_subtitle", default_subtitle)
+                        brand_for_publish = ss.get("brand", brand)
+                        brand_meta_publish = get_brand_meta_all()[brand_for_publish]
+
+                        # Use current chosen filename
+                        widget_file_name = ss.get("widget_file_name", base_filename)
+                        expected_embed_url = current_embed_url(
+                            effective_github_user, repo_name, widget_file_name
+                        )
 
-                    progress.progress(80)
+                        # Generate final HTML with the real embed URL
+                        html_final = generate_html_from_df(
+                            df,
+                            title_for_publish,
+                            subtitle_for_publish,
+                            expected_embed_url,
+                            brand_meta_publish["logo_url"],
+                            brand_meta_publish["logo_alt"],
+                            brand_meta_publish["brand_class"],
+                        )
 
-                    # 1) Ensure repo exists
-                    ensure_repo_exists(
-                        effective_github_user,
-                        repo_name.strip(),
-                        GITHUB_TOKEN,
-                    )
+                        # 1) Ensure repo exists
+                        status.update(label="Checking repository...")
+                        ensure_repo_exists(
+                            effective_github_user,
+                            repo_name.strip(),
+                            GITHUB_TOKEN,
+                        )
 
-                    progress.progress(90)
+                        # 2) Enable GitHub Pages (best effort)
+                        try:
+                            ensure_pages_enabled(
+                                effective_github_user,
+                                repo_name.strip(),
+                                GITHUB_TOKEN,
+                                branch="main",
+                            )
+                        except Exception:
+                            pass  # soft failure
 
-                    # 2) Enable GitHub Pages (best effort)
-                    try:
-                        ensure_pages_enabled(
+                        # 3) Upload HTML file to chosen path (supermoon_table.html or wN.html)
+                        status.update(label=f"Uploading {widget_file_name}...")
+                        upload_file_to_github(
                             effective_github_user,
                             repo_name.strip(),
                             GITHUB_TOKEN,
+                            widget_file_name,
+                            html_final,
+                            f"Add/update {widget_file_name} from Streamlit app",
                             branch="main",
                         )
-                    except Exception:
-                        pass  # soft failure
-
-                    # 3) Upload HTML file to chosen path (supermoon_table.html or wN.html)
-                    upload_file_to_github(
-                        effective_github_user,
-                        repo_name.strip(),
-                        GITHUB_TOKEN,
-                        widget_file_name,
-                        html_final,
-                        f"Add/update {widget_file_name} from Streamlit app",
-                        branch="main",
-                    )
-
-                    # 4) Trigger Pages build
-                    trigger_pages_build(
-                        effective_github_user,
-                        repo_name.strip(),
-                        GITHUB_TOKEN,
-                    )
 
-                    progress.progress(100)
-                    time.sleep(0.15)
-                    progress_placeholder.empty()
-
-                    iframe_snippet = f"""<iframe src="{expected_embed_url}"
-  title="{title_for_publish}"
-  width="100%" height="650"
-  scrolling="no"
-  style="border:0;" loading="lazy"></iframe>"""
+                        # 4) Trigger Pages build
+                        trigger_pages_build(
+                            effective_github_user,
+                            repo_name.strip(),
+                            GITHUB_TOKEN,
+                        )
 
-                    st.session_state["iframe_snippet"] = iframe_snippet
-                    st.session_state["has_generated"] = True
+                        # the snippet itself is built when the Iframe code tab is shown
+                        st.session_state["iframe_published"] = (expected_embed_url, title_for_publish)
+                        st.session_state["has_generated"] = True
+                        probe_availability.clear()  # the repo contents just changed
 
-                    st.success("Widget iframe updated. Open the tabs below to preview and embed it.")
+                        status.update(
+                            label="Widget iframe updated. Open the tabs below to preview and embed it.",
+                            state="complete",
+                        )
 
-                except Exception as e:
-                    progress_placeholder.empty()
-                    st.error(f"GitHub publish failed: {e}")
+                    except Exception as e:
+                        status.update(label=f"GitHub publish failed: {e}", state="error")
 
     # ---------- Availability result + options ----------
-    availability = st.session_state.get("availability")
     if GITHUB_TOKEN and effective_github_user and repo_name.strip():
-        if availability:
-            repo_exists = availability.get("repo_exists", False)
-            file_exists = availability.get("file_exists", False)
-            checked_filename = availability.get("checked_filename", base_filename)
-            suggested_new_filename = availability.get("suggested_new_filename") or "w1.html"
-
-            if not repo_exists:
-                st.info(
-                    "No existing repo found for this campaign. "
-                    "When you click **Update widget**, the repo will be created and "
-                    f"your widget will be saved as `{checked_filename}`."
-                )
-                st.session_state["widget_file_name"] = checked_filename
-            elif repo_exists and not file_exists:
-                st.success(
-                    f"Repo exists and `{checked_filename}` is available. "
-                    "Update widget will save your table to this file."
-                )
-                st.session_state["widget_file_name"] = checked_filename
-            else:
-                st.warning(
-                    f"A page named `{checked_filename}` already exists in this repo."
-                )
-                choice = st.radio(
-                    "What would you like to do?",
-                    options=[
-                        "Replace existing widget (overwrite file)",
-                        f"Create additional widget file in same repo (use {suggested_new_filename})",
-                        "Change campaign name instead",
-                    ],
-                    key="file_conflict_choice",
-                )
-                if choice.startswith("Replace"):
-                    st.session_state["widget_file_name"] = checked_filename
-                    st.info(f"Update widget will overwrite `{checked_filename}` in this repo.")
-                elif choice.startswith("Create additional"):
-                    st.session_state["widget_file_name"] = suggested_new_filename
-                    st.info(
-                        f"Update widget will create a new file `{suggested_new_filename}` "
-                        "in the same repo for this widget."
-                    )
-                else:
-                    st.info(
-                        "Update the campaign name above, then run **Page availability check** again."
-                    )
+        render_availability(base_filename)
 
     st.markdown("---")
 
     # ---------- Output tabs (only AFTER first publish, or if no token) ----------
-    has_generated = st.session_state.get("has_generated", False)
+    has_generated = ss.get("has_generated", False)
     show_tabs = has_generated or not GITHUB_TOKEN  # allow preview when token missing
 
     # recompute for preview using current chosen file name and brand
-    widget_file_name = st.session_state.get("widget_file_name", base_filename)
-    expected_embed_url = compute_expected_embed_url(
+    widget_file_name = ss.get("widget_file_name", base_filename)
+    expected_embed_url = current_embed_url(
         effective_github_user, repo_name, widget_file_name
     )
 
     if show_tabs:
-        # Main tabs
-        tab_config, tab_embed = st.tabs(
-            [
-                "Configure & preview widget",
-                "Widgets HTML/Iframe",
-            ]
+        # Main views: a horizontal radio instead of st.tabs, so only the
+        # selected view's body runs on each rerun
+        view_config = "Configure & preview widget"
+        view_embed = "Widgets HTML/Iframe"
+        active_view = st.radio(
+            "View",
+            options=[view_config, view_embed],
+            horizontal=True,
+            key="active_tab",
+            label_visibility="collapsed",
         )
 
-        # -------- TAB 1: Configure & preview widget --------
-        with tab_config:
-            # controls on top
-            col_title, col_sub = st.columns(2)
-
-            with col_title:
-                widget_title = st.text_input(
-                    "Widget name",
-                    value=st.session_state.get("widget_title", default_title),
-                    key="widget_title",
-                )
-
-            with col_sub:
-                widget_subtitle = st.text_input(
-                    "Widget subtitle",
-                    value=st.session_state.get("widget_subtitle", default_subtitle),
-                    key="widget_subtitle",
-                )
-
-            # preview below
-            brand_meta_preview = get_brand_meta(st.session_state.get("brand", brand))
-
-            html_preview = generate_html_from_df(
+        # widget keys own the text; re-assigning them keeps typed values while
+        # the configure view (and its inputs) isn't rendered
+        st.session_state["widget_title"] = ss.get("widget_title", default_title)
+        st.session_state["widget_subtitle"] = ss.get("widget_subtitle", default_subtitle)
+        widget_title = ss["widget_title"]
+        widget_subtitle = ss["widget_subtitle"]
+
+        # preview HTML is shared by both views: regenerate only when its inputs changed
+        preview_brand = ss.get("brand", brand)
+        preview_inputs = (
+            getattr(uploaded_file, "file_id", None),
+            widget_title,
+            widget_subtitle,
+            expected_embed_url,
+            preview_brand,
+        )
+        if (
+            "html_preview" not in ss
+            or ss.get("preview_inputs") != preview_inputs
+        ):
+            brand_meta_preview = get_brand_meta_all()[preview_brand]
+            st.session_state["html_preview"] = generate_html_from_df(
                 df,
                 widget_title,
                 widget_subtitle,
@@ -1560,24 +1730,43 @@ if uploaded_file is not None:
                 brand_meta_preview["logo_alt"],
                 brand_meta_preview["brand_class"],
             )
+            st.session_state["preview_inputs"] = preview_inputs
+        html_preview = ss["html_preview"]
+
+        # -------- VIEW 1: Configure & preview widget --------
+        if active_view == view_config:
+            # controls on top, batched in a form so typing doesn't rerun the preview
+            with st.form("widget_preview_form", clear_on_submit=False):
+                col_title, col_sub = st.columns(2)
+
+                with col_title:
+                    st.text_input("Widget name", key="widget_title")
+
+                with col_sub:
+                    st.text_input("Widget subtitle", key="widget_subtitle")
 
+                st.form_submit_button("Refresh preview")
+
+            # preview below
             components.html(html_preview, height=650, scrolling=True)
 
-        # -------- TAB 2: Widgets HTML/Iframe --------
-        with tab_embed:
+        # -------- VIEW 2: Widgets HTML/Iframe --------
+        else:
             subtab_html, subtab_iframe = st.tabs(["HTML file contents", "Iframe code"])
 
             with subtab_html:
-                st.text_area(
-                    label="",
-                    value=html_preview,
-                    height=350,
-                    label_visibility="collapsed",
-                )
+                # one-way render (not a widget), with a built-in copy button
+                st.code(html_preview, language="html", height=350)
 
             with subtab_iframe:
                 st.markdown("**Current iframe code:**")
-                if st.session_state.get("iframe_snippet"):
-                    st.code(st.session_state["iframe_snippet"], language="html")
+                if ss.get("iframe_published"):
+                    published_url, published_title = ss["iframe_published"]
+                    iframe_snippet = f"""<iframe src="{published_url}"
+  title="{published_title}"
+  width="100%" height="650"
+  scrolling="no"
+  style="border:0;" loading="lazy"></iframe>"""
+                    st.code(iframe_snippet, language="html")
                 else:
                     st.info("No iframe yet – click **Update widget** above to generate it.")
@@ -1,7 +1,15 @@
 import base64
-import time
+import functools
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 import re
+import time
+import types
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
@@ -18,17 +26,86 @@ def get_secret(key: str, default: str = "") -> str:
 
 GITHUB_TOKEN = get_secret("GITHUB_TOKEN", "")
 GITHUB_USER_DEFAULT = get_secret("GITHUB_USER", "")
+# REST root; set GITHUB_API_URL to point at a GitHub Enterprise server
+GITHUB_API_URL = get_secret("GITHUB_API_URL", "https://api.github.com").rstrip("/")
 
 # === GitHub helpers ===================================================
 
+class RateLimitError(RuntimeError):
+    """GitHub refused the request for rate limiting; `wait` is seconds until retry."""
+
+    def __init__(self, wait: int, message: str = ""):
+        self.wait = wait
+        super().__init__(message or f"GitHub rate limit reached; retry in {wait}s.")
+
+
+def _rate_limit_hook(response, *args, **kwargs):
+    """
+    Session response hook. A rate-limited response (429, or 403 with no
+    requests left) raises RateLimitError instead of being treated as a normal
+    API error. When only a few requests remain and the window resets within
+    a few seconds, wait for the reset rather than running into the limit.
+    """
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset = response.headers.get("X-RateLimit-Reset")
+    until_reset = max(0, int(reset) - int(time.time())) if reset and reset.isdigit() else None
+
+    if response.status_code == 429 or (response.status_code == 403 and remaining == "0"):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            wait = int(retry_after)
+        else:
+            wait = until_reset if until_reset is not None else 60
+        raise RateLimitError(wait)
+
+    if remaining and remaining.isdigit() and int(remaining) < 5:
+        if until_reset is not None and until_reset <= 5:
+            time.sleep(until_reset)
+    return response
+
+
+@st.cache_resource(show_spinner=False)
+def github_session() -> requests.Session:
+    """
+    One keep-alive session for every GitHub call, shared across reruns,
+    so a publish reuses a single TLS connection to the GitHub API.
+    Transient 5xx on reads are retried with a short backoff; rate-limited
+    responses raise RateLimitError (see _rate_limit_hook).
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,  # hand the last response back to the status checks
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+    session.hooks["response"].append(_rate_limit_hook)
+    return session
+
+@functools.lru_cache(maxsize=4)
 def github_headers(token: str):
+    """
+    Request headers for a token, built once per token. Read-only: copy with
+    {**github_headers(token), ...} to add per-request headers.
+    """
     headers = {
         "Accept": "application/vnd.github+json",
     }
     if token:
         headers["Authorization"] = f"Bearer {token}"
     headers["X-GitHub-Api-Version"] = "2022-11-28"
-    return headers
+    return types.MappingProxyType(headers)
+
+
+def repo_url(owner: str, repo: str) -> str:
+    return f"{GITHUB_API_URL}/repos/{owner}/{repo}"
+
+
+def contents_url(owner: str, repo: str, path: str = "") -> str:
+    url = f"{repo_url(owner, repo)}/contents"
+    return f"{url}/{path}" if path else url
 
 
 def ensure_repo_exists(owner: str, repo: str, token: str) -> bool:
@@ -38,10 +115,9 @@ def ensure_repo_exists(owner: str, repo: str, token: str) -> bool:
       True  -> repo was just created
       False -> repo already existed
     """
-    api_base = "https://api.github.com"
     headers = github_headers(token)
 
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}", headers=headers)
+    r = github_session().get(repo_url(owner, repo), headers=headers)
     if r.status_code == 200:
         return False  # already exists
     if r.status_code != 404:
@@ -53,34 +129,73 @@ def ensure_repo_exists(owner: str, repo: str, token: str) -> bool:
         "private": False,
         "description": "Stadium fan experience widget (auto-created by Streamlit app).",
     }
-    r = requests.post(f"{api_base}/user/repos", headers=headers, json=payload)
+    r = github_session().post(f"{GITHUB_API_URL}/user/repos", headers=headers, json=payload)
     if r.status_code not in (200, 201):
         raise RuntimeError(f"Error creating repo: {r.status_code} {r.text}")
 
     return True  # newly created
 
 
-def ensure_pages_enabled(owner: str, repo: str, token: str, branch: str = "main") -> None:
+def ensure_pages_enabled(owner: str, repo: str, token: str, branch: str = "main") -> bool:
     """
     Attempt to enable GitHub Pages on the repo from the given branch root.
     If Pages is already enabled, this is a no-op.
+    Returns True once Pages is enabled, False if the token may not manage it.
     """
-    api_base = "https://api.github.com"
     headers = github_headers(token)
 
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}/pages", headers=headers)
+    r = github_session().get(f"{repo_url(owner, repo)}/pages", headers=headers)
     if r.status_code == 200:
-        return
+        return True
     if r.status_code not in (404, 403):
         raise RuntimeError(f"Error checking GitHub Pages: {r.status_code} {r.text}")
     if r.status_code == 403:
         # No permission via API; nothing we can do programmatically.
-        return
+        return False
 
     payload = {"source": {"branch": branch, "path": "/"}}
-    r = requests.post(f"{api_base}/repos/{owner}/{repo}/pages", headers=headers, json=payload)
+    r = github_session().post(f"{repo_url(owner, repo)}/pages", headers=headers, json=payload)
     if r.status_code not in (201, 202):
         raise RuntimeError(f"Error enabling GitHub Pages: {r.status_code} {r.text}")
+    return True
+
+
+def _fetch_file_sha(url: str, headers: dict, branch: str, cached: dict):
+    """
+    Current blob sha for a contents URL (None if the file doesn't exist).
+    Sends If-None-Match with a cached ETag; a 304 reuses the cached sha.
+    """
+    req_headers = headers
+    if cached and cached.get("etag"):
+        req_headers = {**headers, "If-None-Match": cached["etag"]}
+    r = github_session().get(url, headers=req_headers, params={"ref": branch})
+    if r.status_code == 304:
+        return cached["sha"], cached["etag"]
+    if r.status_code == 200:
+        return r.json().get("sha"), r.headers.get("ETag")
+    if r.status_code == 404:
+        return None, None
+    raise RuntimeError(f"Error checking file: {r.status_code} {r.text}")
+
+
+def git_blob_sha(raw: bytes) -> str:
+    """The sha GitHub reports for a file with these bytes (git hash-object)."""
+    return hashlib.sha1(b"blob %d\0" % len(raw) + raw).hexdigest()
+
+
+def _contents_put_body(encoded: bytes, message: str, branch: str, sha=None) -> bytes:
+    """
+    JSON body for PUT /contents. The base64 content is already JSON-safe ASCII,
+    so it is spliced in as bytes instead of going through a str + json.dumps copy.
+    """
+    fields = {"message": message, "branch": branch}
+    if sha:
+        fields["sha"] = sha
+    return b'{"content":"' + encoded + b'",' + json.dumps(fields).encode("utf-8")[1:]
+
+
+# The contents API rejects files around 1 MB; fail before encoding and uploading
+MAX_HTML_BYTES = 900_000
 
 
 def upload_file_to_github(
@@ -91,52 +206,76 @@ def upload_file_to_github(
     content: str,
     message: str,
     branch: str = "main",
-) -> None:
+) -> bool:
     """
     Create or update a file in the repo at the given path.
+    The blob sha is remembered per (owner, repo, path, branch) in
+    st.session_state["gh_sha_cache"]: a republish from this session reuses the
+    sha returned by the last PUT and only re-reads it if GitHub reports a conflict.
+    Returns False without writing when the file already holds this exact content.
     """
-    api_base = "https://api.github.com"
     headers = github_headers(token)
 
-    get_url = f"{api_base}/repos/{owner}/{repo}/contents/{path}"
-    params = {"ref": branch}
-    r = requests.get(get_url, headers=headers, params=params)
-    sha = None
-    if r.status_code == 200:
-        sha = r.json().get("sha")
-    elif r.status_code not in (404,):
-        raise RuntimeError(f"Error checking file: {r.status_code} {r.text}")
-
-    encoded = base64.b64encode(content.encode("utf-8")).decode("utf-8")
+    get_url = contents_url(owner, repo, path)
+    sha_cache = st.session_state.setdefault("gh_sha_cache", {})
+    cache_key = (owner, repo, path, branch)
+    cached = sha_cache.get(cache_key)
 
-    payload = {
-        "message": message,
-        "content": encoded,
-        "branch": branch,
-    }
-    if sha:
-        payload["sha"] = sha
+    raw = content.encode("utf-8")  # encoded once; reused for the sha and the upload
+    if len(raw) > MAX_HTML_BYTES:
+        raise ValueError(
+            f"Widget HTML is {len(raw):,} bytes, over the {MAX_HTML_BYTES:,}-byte limit "
+            "for GitHub file uploads; move large assets to a CDN."
+        )
+    local_sha = git_blob_sha(raw)
 
-    r = requests.put(get_url, headers=headers, json=payload)
+    if cached and cached.get("from_put") and cached["sha"] != local_sha:
+        sha = cached["sha"]  # our own last write; no GET needed
+    else:
+        # unknown remote state, or it may already match: read the current sha
+        sha, etag = _fetch_file_sha(get_url, headers, branch, cached)
+        if sha:
+            sha_cache[cache_key] = {"sha": sha, "etag": etag}
+    if sha == local_sha:
+        return False  # unchanged; skip the PUT and the empty commit
+
+    encoded = base64.b64encode(raw)  # ASCII bytes, spliced as-is
+    put_headers = {**headers, "Content-Type": "application/json"}
+
+    r = github_session().put(
+        get_url, headers=put_headers, data=_contents_put_body(encoded, message, branch, sha)
+    )
+    if r.status_code in (409, 422) and cached and cached.get("from_put"):
+        # file changed elsewhere since our last write: re-read the sha and retry once
+        sha, etag = _fetch_file_sha(get_url, headers, branch, None)
+        r = github_session().put(
+            get_url, headers=put_headers, data=_contents_put_body(encoded, message, branch, sha)
+        )
     if r.status_code not in (200, 201):
+        sha_cache.pop(cache_key, None)
         raise RuntimeError(f"Error uploading file: {r.status_code} {r.text}")
 
+    new_sha = (r.json().get("content") or {}).get("sha")
+    if new_sha:
+        sha_cache[cache_key] = {"sha": new_sha, "etag": None, "from_put": True}
+    else:
+        sha_cache.pop(cache_key, None)
+    return True
+
 
 def trigger_pages_build(owner: str, repo: str, token: str) -> bool:
     """
     Ask GitHub to build the Pages site (legacy mode).
     """
-    api_base = "https://api.github.com"
     headers = github_headers(token)
-    r = requests.post(f"{api_base}/repos/{owner}/{repo}/pages/builds", headers=headers)
+    r = github_session().post(f"{repo_url(owner, repo)}/pages/builds", headers=headers)
     return r.status_code in (201, 202)
 
 # --- Availability helpers ---------------------------------------------
 
 def check_repo_exists(owner: str, repo: str, token: str) -> bool:
-    api_base = "https://api.github.com"
     headers = github_headers(token)
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}", headers=headers)
+    r = github_session().get(repo_url(owner, repo), headers=headers)
     if r.status_code == 200:
         return True
     if r.status_code == 404:
@@ -144,88 +283,162 @@ def check_repo_exists(owner: str, repo: str, token: str) -> bool:
     raise RuntimeError(f"Error checking repo: {r.status_code} {r.text}")
 
 
-def check_file_exists(owner: str, repo: str, token: str, path: str, branch: str = "main") -> bool:
-    api_base = "https://api.github.com"
+def list_root_contents(owner: str, repo: str, token: str, branch: str = "main"):
+    """
+    List the items at the root of the repo.
+    Returns None when the listing is unavailable (missing or empty repo).
+    """
     headers = github_headers(token)
-    r = requests.get(
-        f"{api_base}/repos/{owner}/{repo}/contents/{path}",
+    r = github_session().get(
+        contents_url(owner, repo),
         headers=headers,
         params={"ref": branch},
     )
-    if r.status_code == 200:
-        return True
-    if r.status_code == 404:
-        return False
-    raise RuntimeError(f"Error checking file: {r.status_code} {r.text}")
+    if r.status_code != 200:
+        return None
+    try:
+        items = r.json()
+    except ValueError:
+        return None
+    return items if isinstance(items, list) else None
+
+
+WIDGET_FILE_RE = re.compile(r"w(\d+)\.html")
 
 
-def find_next_widget_filename(owner: str, repo: str, token: str, branch: str = "main") -> str:
+def find_next_widget_filename(
+    owner: str, repo: str, token: str, branch: str = "main", items=None
+) -> str:
     """
     Look at the root of the repo and find the next available wN.html filename.
+    Pass `items` from list_root_contents() to reuse a listing already fetched.
     Returns 'w1.html' if none are found or on fallback.
     """
-    api_base = "https://api.github.com"
-    headers = github_headers(token)
-    r = requests.get(
-        f"{api_base}/repos/{owner}/{repo}/contents",
-        headers=headers,
-        params={"ref": branch},
-    )
-    if r.status_code != 200:
+    if items is None:
+        items = list_root_contents(owner, repo, token, branch)
+    if items is None:
         return "w1.html"
 
-    max_n = 0
     try:
-        items = r.json()
-        for item in items:
-            if item.get("type") == "file":
-                name = item.get("name", "")
-                m = re.fullmatch(r"w(\d+)\.html", name)
-                if m:
-                    max_n = max(max_n, int(m.group(1)))
+        max_n = max(
+            (
+                int(m.group(1))
+                for item in items
+                if item.get("type") == "file"
+                for m in (WIDGET_FILE_RE.fullmatch(item.get("name", "")),)
+                if m
+            ),
+            default=0,
+        )
     except Exception:
         return "w1.html"
 
-    return f"w{max_n + 1}.html" if max_n >= 0 else "w1.html"
+    return f"w{max_n + 1}.html"
 
-# === Brand metadata ===================================================
 
-def get_brand_meta(brand: str) -> dict:
+def preflight(owner: str, repo: str, token: str, branch: str = "main") -> dict:
     """
-    Brand metadata: name, logo, alt text, and a CSS class
-    used to theme the widget.
+    Fire the independent availability lookups concurrently:
+    repo existence and the root listing (file existence + next wN.html).
     """
-    default_logo = "https://i.postimg.cc/x1nG117r/AN-final2-logo.png"
-    brand_clean = (brand or "").strip() or "Action Network"
-
-    meta = {
-        "name": brand_clean,
-        "logo_url": default_logo,
-        "logo_alt": f"{brand_clean} logo",
-        "brand_class": "brand-actionnetwork",
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        key = token_cache_key(token)
+        repo_future = pool.submit(cached_repo_exists, owner, repo, key, token)
+        items_future = pool.submit(cached_root_contents, owner, repo, key, token, branch)
+        repo_exists = repo_future.result()
+        items = items_future.result()
+
+    if not repo_exists:
+        items = None
+    names = {
+        item.get("name", "")
+        for item in (items or [])
+        if item.get("type") == "file"
     }
+    return {"repo_exists": repo_exists, "names": names, "items": items}
+
+# --- Cached probes ----------------------------------------------------
+# Repo / Pages state changes about once per session, so the probes are cached
+# across reruns. The cache key carries a short token hash; the token itself is
+# passed as an underscore argument, which st.cache_data does not hash or store.
+
+def token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_repo_exists(owner: str, repo: str, token_key: str, _token: str) -> bool:
+    return check_repo_exists(owner, repo, _token)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_ensure_repo_exists(owner: str, repo: str, token_key: str, _token: str) -> bool:
+    return ensure_repo_exists(owner, repo, _token)
 
-    if brand_clean == "Action Network":
-        meta["brand_class"] = "brand-actionnetwork"
-        meta["logo_url"] = "https://i.postimg.cc/x1nG117r/AN-final2-logo.png"
-        meta["logo_alt"] = "Action Network logo"
 
-    elif brand_clean == "VegasInsider":
-        meta["brand_class"] = "brand-vegasinsider"
-        meta["logo_url"] = "https://i.postimg.cc/kGVJyXc1/VI-logo-final.png"
-        meta["logo_alt"] = "VegasInsider logo"
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_ensure_pages_enabled(
+    owner: str, repo: str, token_key: str, _token: str, branch: str = "main"
+) -> bool:
+    return ensure_pages_enabled(owner, repo, _token, branch=branch)
 
-    elif brand_clean == "Canada Sports Betting":
-        meta["brand_class"] = "brand-canadasb"
-        meta["logo_url"] = "https://i.postimg.cc/ZKbrbPCJ/CSB-FN.png"
-        meta["logo_alt"] = "Canada Sports Betting logo"
 
-    elif brand_clean == "RotoGrinders":
-        meta["brand_class"] = "brand-rotogrinders"
-        meta["logo_url"] = "https://i.postimg.cc/PrcJnQtK/RG-logo-Fn.png"
-        meta["logo_alt"] = "RotoGrinders logo"
+@st.cache_data(ttl=30, show_spinner=False)
+def cached_root_contents(
+    owner: str, repo: str, token_key: str, _token: str, branch: str = "main"
+):
+    return list_root_contents(owner, repo, _token, branch)
 
-    return meta
+
+def clear_probe_caches() -> None:
+    """Drop the availability answers after a publish changed the repo."""
+    cached_repo_exists.clear()
+    cached_root_contents.clear()
+
+# === Brand metadata ===================================================
+
+_DEFAULT_LOGO_URL = "https://i.postimg.cc/x1nG117r/AN-final2-logo.png"
+
+_BRAND_META = types.MappingProxyType({
+    "Action Network": types.MappingProxyType({
+        "brand_class": "brand-actionnetwork",
+        "logo_url": _DEFAULT_LOGO_URL,
+        "logo_alt": "Action Network logo",
+    }),
+    "VegasInsider": types.MappingProxyType({
+        "brand_class": "brand-vegasinsider",
+        "logo_url": "https://i.postimg.cc/kGVJyXc1/VI-logo-final.png",
+        "logo_alt": "VegasInsider logo",
+    }),
+    "Canada Sports Betting": types.MappingProxyType({
+        "brand_class": "brand-canadasb",
+        "logo_url": "https://i.postimg.cc/ZKbrbPCJ/CSB-FN.png",
+        "logo_alt": "Canada Sports Betting logo",
+    }),
+    "RotoGrinders": types.MappingProxyType({
+        "brand_class": "brand-rotogrinders",
+        "logo_url": "https://i.postimg.cc/PrcJnQtK/RG-logo-Fn.png",
+        "logo_alt": "RotoGrinders logo",
+    }),
+})
+
+
+def get_brand_meta(brand: str) -> dict:
+    """
+    Brand metadata: name, logo, alt text, and a CSS class
+    used to theme the widget. Unknown brands fall back to the
+    Action Network logo and theme.
+    """
+    brand_clean = (brand or "").strip() or "Action Network"
+    meta = _BRAND_META.get(brand_clean)
+    if meta is None:
+        return {
+            "name": brand_clean,
+            "logo_url": _DEFAULT_LOGO_URL,
+            "logo_alt": f"{brand_clean} logo",
+            "brand_class": "brand-actionnetwork",
+        }
+    return {"name": brand_clean, **meta}
 
 # === State flags by USPS abbreviation (for city chips) ===============
 
@@ -364,25 +577,25 @@ HTML_TEMPLATE = r"""<!doctype html>
     }
 
     .vi-compact-embed .head{
-      padding:14px 16px;border-bottom:1px solid var(--border)!important;color:#fff!important;
+      padding:14px 16px;border-bottom:1px solid var(--border);color:#fff;
       background:
         radial-gradient(120% 140% at 85% 10%, rgba(255,255,255,.10) 0%, transparent 60%),
-        linear-gradient(90deg,var(--brand-900) 0%,var(--brand-600) 45%,var(--brand-500) 100%)!important;
+        linear-gradient(90deg,var(--brand-900) 0%,var(--brand-600) 45%,var(--brand-500) 100%);
     }
-    .vi-compact-embed .title{margin:0 0 2px;font-size:clamp(16px,2.2vw,20px);line-height:1.2;font-weight:800;color:#fff!important}
-    .vi-compact-embed .sub{margin:0;color:rgba(255,255,255,.92)!important;font-size:12px}
-    .vi-compact-embed .meta{margin:4px 0 0;color:rgba(255,255,255,.85)!important;font-size:12px}
+    .vi-compact-embed .title{margin:0 0 2px;font-size:clamp(16px,2.2vw,20px);line-height:1.2;font-weight:800;color:#fff}
+    .vi-compact-embed .sub{margin:0;color:rgba(255,255,255,.92);font-size:12px}
+    .vi-compact-embed .meta{margin:4px 0 0;color:rgba(255,255,255,.85);font-size:12px}
 
     .vi-compact-embed .table{padding:10px 12px}
     .vi-compact-embed .row{
       display:grid;grid-template-columns:36px 1.6fr minmax(220px,1.2fr);gap:8px;align-items:center;margin:6px 0;
-      border:1px solid var(--border)!important;border-radius:12px;padding:8px 10px;background:#fff!important;
+      border:1px solid var(--border);border-radius:12px;padding:8px 10px;background:#fff;
       transition:transform .18s cubic-bezier(.2,.8,.2,1),box-shadow .18s ease,background-color .15s ease,border-color .15s ease;
       transform-origin:center;
     }
     .vi-compact-embed .row:hover,.vi-compact-embed .row:focus-within{
-      background:linear-gradient(0deg,var(--hover-tint),var(--hover-tint)),#fff!important;
-      transform:scale(1.01);box-shadow:var(--hover-shadow);border-color:var(--hover-ring)!important;
+      background:linear-gradient(0deg,var(--hover-tint),var(--hover-tint)),#fff;
+      transform:scale(1.01);box-shadow:var(--hover-shadow);border-color:var(--hover-ring);
     }
     @media (prefers-reduced-motion:reduce){
       .vi-compact-embed .row{transition:none}
@@ -418,39 +631,39 @@ HTML_TEMPLATE = r"""<!doctype html>
     }
     .vi-compact-embed .bar{
       position:absolute;inset:0 auto 0 0;border-radius:999px;
-      background:linear-gradient(90deg,var(--brand-600),var(--brand-500))!important;
+      background:linear-gradient(90deg,var(--brand-600),var(--brand-500));
       box-shadow:inset 0 0 0 1px rgba(0,0,0,.04)
     }
 
     /* Fan Experience gradient bands – smoother 6-step scale */
     .vi-compact-embed .bar.fan-band.band-1{
-      background:linear-gradient(90deg,var(--brand-100),var(--brand-50))!important;
+      background:linear-gradient(90deg,var(--brand-100),var(--brand-50));
     } /* very low */
 
     .vi-compact-embed .bar.fan-band.band-2{
-      background:linear-gradient(90deg,var(--brand-300),var(--brand-100))!important;
+      background:linear-gradient(90deg,var(--brand-300),var(--brand-100));
     } /* low */
 
     .vi-compact-embed .bar.fan-band.band-3{
-      background:linear-gradient(90deg,var(--brand-500),var(--brand-300))!important;
+      background:linear-gradient(90deg,var(--brand-500),var(--brand-300));
     } /* mid */
 
     .vi-compact-embed .bar.fan-band.band-4{
-      background:linear-gradient(90deg,var(--brand-600),var(--brand-500))!important;
+      background:linear-gradient(90deg,var(--brand-600),var(--brand-500));
     } /* mid-high */
 
     .vi-compact-embed .bar.fan-band.band-5{
-      background:linear-gradient(90deg,var(--brand-700),var(--brand-600))!important;
+      background:linear-gradient(90deg,var(--brand-700),var(--brand-600));
     } /* high */
 
     .vi-compact-embed .bar.fan-band.band-6{
-      background:linear-gradient(90deg,var(--brand-900),var(--brand-700))!important;
+      background:linear-gradient(90deg,var(--brand-900),var(--brand-700));
     } /* elite */
 
     .vi-compact-embed .val{
       position:absolute;right:6px;top:50%;transform:translateY(-50%);
       font-variant-numeric:tabular-nums;font-weight:800;font-size:13px;
-      color:#0e1a12!important;background:#fff!important;border:2px solid #e6e9ed!important;border-radius:999px;padding:2px 8px
+      color:#0e1a12;background:#fff;border:2px solid #e6e9ed;border-radius:999px;padding:2px 8px
     }
 
     .vi-compact-embed .details{
@@ -496,7 +709,7 @@ HTML_TEMPLATE = r"""<!doctype html>
     .vi-compact-embed .details-close:hover{border-color:var(--hover-ring)}
 
     .vi-compact-embed .row.is-clickable{cursor:pointer}
-    .vi-compact-embed .row.is-clickable[aria-expanded="true"]{border-color:var(--brand-600)!important}
+    .vi-compact-embed .row.is-clickable[aria-expanded="true"]{border-color:var(--brand-600)}
 
     /* Desktop internal scroll – match Supermoon behaviour */
     .vi-compact-embed{
@@ -521,11 +734,11 @@ HTML_TEMPLATE = r"""<!doctype html>
 
     /* Footer + embed button */
     .vi-compact-embed .vi-footer {
-      display:block!important;text-align:center;padding:12px 0 4px;min-height:64px;
+      display:block;text-align:center;padding:12px 0 4px;min-height:64px;
       border-top:1px solid var(--border);
       background:
         radial-gradient(120% 140% at 85% 10%, rgba(255,255,255,.10) 0%, transparent 60%),
-        linear-gradient(90deg,var(--brand-900) 0%,var(--brand-600) 45%,var(--brand-500) 100%)!important;
+        linear-gradient(90deg,var(--brand-900) 0%,var(--brand-600) 45%,var(--brand-500) 100%);
       color:#fff;position:relative;overflow:visible;
     }
     .vi-compact-embed .footer-inner{
@@ -563,7 +776,7 @@ HTML_TEMPLATE = r"""<!doctype html>
 
     /* Mobile overrides – same pattern as Supermoon */
     @media (max-width:640px){
-      html, body { height:auto !important; overflow:auto !important; }
+      html, body { height:auto; overflow:auto; }
 
       .vi-compact-embed{
         display:block;
@@ -572,19 +785,19 @@ HTML_TEMPLATE = r"""<!doctype html>
         --pane-max-h:min(70vh,560px);
       }
       .vi-compact-embed .table{
-        max-height:var(--pane-max-h)!important;
-        overflow:auto!important;
-        -webkit-overflow-scrolling:touch!important;
+        max-height:var(--pane-max-h);
+        overflow:auto;
+        -webkit-overflow-scrolling:touch;
       }
 
       .vi-compact-embed .footer-inner{
-        justify-content:space-between!important;
+        justify-content:space-between;
         padding:0 10px;
         gap:8px;
       }
       .vi-compact-embed .embed-btn{
-        position:static!important;
-        transform:none!important;
+        position:static;
+        transform:none;
         padding:6px 10px;
         font-size:12px;
         flex-shrink:0;
@@ -592,17 +805,17 @@ HTML_TEMPLATE = r"""<!doctype html>
       .vi-compact-embed .vi-footer img{height:44px;}
 
       .vi-compact-embed .embed-wrapper{
-        position:absolute!important;
-        bottom:calc(100% + 10px)!important;
-        left:50%!important;
-        transform:translateX(-50%)!important;
-        width:min(600px, calc(100% - 24px))!important;
+        position:absolute;
+        bottom:calc(100% + 10px);
+        left:50%;
+        transform:translateX(-50%);
+        width:min(600px, calc(100% - 24px));
         max-height:65vh;
         overflow:auto;
         z-index:1000;
       }
 
-      .vi-compact-embed .details.open{max-height:none!important;}
+      .vi-compact-embed .details.open{max-height:none;}
       .vi-compact-embed .details{
         display:flex;
         flex-direction:column;
@@ -860,110 +1073,220 @@ HTML_TEMPLATE = r"""<!doctype html>
 
 # === 2. Generator: build rows + DATA ==================================
 
-def generate_html_from_df(
-    df: pd.DataFrame,
-    title: str,
-    subtitle: str,
-    embed_url: str,
-    brand_logo_url: str,
-    brand_logo_alt: str,
-    brand_class: str,
-) -> str:
-    df = df.copy()
-    df = df.sort_values("rank", ascending=True).reset_index(drop=True)
+STYLE_BLOCK_RE = re.compile(r"(<style>)(.*?)(</style>)", re.S)
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+CSS_PUNCT_SPACE_RE = re.compile(r"\s*([{};,])\s*")
 
-    max_fan = float(df["fan_score"].max() or 1.0)
 
-    def band_for_fan(score: float) -> str:
-        # 6 bands for smoother color steps
-        if score >= 75.0:
-            return "band-6"
-        elif score >= 65.0:
-            return "band-5"
-        elif score >= 55.0:
-            return "band-4"
-        elif score >= 45.0:
-            return "band-3"
-        elif score >= 35.0:
-            return "band-2"
-        else:
-            return "band-1"
-
-    row_snippets = []
-    for _, row in df.iterrows():
-        rank = int(row["rank"])
-        city_label = str(row["city"])  # expected like "San Diego, CA"
-
-        # Try to extract state abbreviation from the city label
-        state_abbrev = ""
-        if "," in city_label:
-            parts = [p.strip() for p in city_label.split(",")]
-            if len(parts) >= 2:
-                state_abbrev = parts[-1]
-
-        flag_url = STATE_FLAG_URLS_ABBR.get(state_abbrev, "")
-        if flag_url:
-            img_html = (
-                f'<img loading="lazy" decoding="async" alt="{state_abbrev} flag" '
-                f'width="18" height="18" src="{flag_url}">'
-            )
-        else:
-            img_html = ""
+def minify_css(css: str) -> str:
+    """
+    Conservative CSS minifier: drops comments, collapses whitespace and trims it
+    around { } ; and commas. Spaces inside values such as calc(a + b) are kept.
+    """
+    css = CSS_COMMENT_RE.sub("", css)
+    css = " ".join(css.split())
+    css = CSS_PUNCT_SPACE_RE.sub(r"\1", css)
+    return css.replace(";}", "}")
+
 
-        crime = float(row["crime_index"])
-        walk = float(row["walk_score"])
-        sent = float(row["sentiment_pct"])
-        fan = float(row["fan_score"])
+# 6 fan-score bands for smoother color steps: band-N starts at FAN_BAND_EDGES[N-2]
+FAN_BAND_EDGES = np.array([35.0, 45.0, 55.0, 65.0, 75.0])
 
-        width_pct = fan / max_fan * 100.0
-        bar_style = f"width:{width_pct:.2f}%;"
-        band_class = band_for_fan(fan)
+# DataFrame column -> key in the widget's DATA object
+DATA_FIELD_NAMES = {
+    "crime_index": "crime",
+    "walk_score": "walk",
+    "sentiment_pct": "sentiment",
+    "fan_score": "fan",
+}
+DATA_COLUMNS = ["city", *DATA_FIELD_NAMES]
 
-        # Row shows rank + flag + city label + overall fan score bar (sub-metrics only in details)
-        row_html = f"""
-    <div class="row is-clickable" data-city="{city_label}" data-rank="{rank}" aria-expanded="false" tabindex="0" role="button">
+# Row shows rank + flag + city label + overall fan score bar (sub-metrics only in details)
+ROW_TEMPLATE = """
+    <div class="row is-clickable" data-city="{city}" data-rank="{rank}" aria-expanded="false" tabindex="0" role="button">
       <div class="rank">{rank}</div>
       <div class="city">
         <span class="city-main">
-          <span class="chip">{img_html}</span>
-          {city_label}
+          <span class="chip">{chip}</span>
+          {city}
         </span>
       </div>
       <div class="metric">
-        <span class="bar fan-band {band_class}" style="{bar_style}"></span>
+        <span class="bar fan-band band-{band}" style="width:{width:.2f}%;"></span>
         <span class="val">{fan:.2f}</span>
       </div>
-    </div>""".rstrip()
-        row_snippets.append(row_html)
-
-    rows_html = "\n\n".join(row_snippets)
-
-    data_lines = []
-    for _, row in df.iterrows():
-        city = str(row["city"])
-        crime = float(row["crime_index"])
-        walk = float(row["walk_score"])
-        sentiment = float(row["sentiment_pct"])
-        fan = float(row["fan_score"])
-        data_lines.append(
-            f'        "{city}":  {{ crime:{crime:.2f}, walk:{walk:.2f}, sentiment:{sentiment:.2f}, fan:{fan:.2f} }}'
+    </div>"""
+
+FLAG_IMG_TEMPLATE = (
+    '<img loading="lazy" decoding="async" alt="{state} flag" '
+    'width="18" height="18" src="{url}">'
+)
+
+
+def flag_chip_html(city_label: str) -> str:
+    """State flag <img> for a label like "San Diego, CA" ("" if no known state)."""
+    state_abbrev = ""
+    if "," in city_label:
+        parts = [p.strip() for p in city_label.split(",")]
+        if len(parts) >= 2:
+            state_abbrev = parts[-1]
+
+    flag_url = STATE_FLAG_URLS_ABBR.get(state_abbrev, "")
+    if not flag_url:
+        return ""
+    return FLAG_IMG_TEMPLATE.format(state=state_abbrev, url=flag_url)
+
+
+TEMPLATE_TOKEN_RE = re.compile(r"\[\[([A-Z_]+)\]\]")
+
+
+@st.cache_resource(show_spinner=False)
+def compiled_html_template() -> tuple:
+    """
+    HTML_TEMPLATE split once per process into alternating literal segments and
+    [[TOKEN]] names (odd indices), with the <style> block minified. Rendering is
+    then a single join; nothing re-scans the template.
+    """
+    html = STYLE_BLOCK_RE.sub(lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), HTML_TEMPLATE)
+    return tuple(TEMPLATE_TOKEN_RE.split(html))
+
+
+def render_html_template(values: dict) -> str:
+    """
+    Fill the compiled template. A value may be a list of string pieces; they are
+    spliced into the one final join instead of being joined into a string first.
+    """
+    out = []
+    for i, part in enumerate(compiled_html_template()):
+        if i % 2 == 0:
+            out.append(part)
+            continue
+        value = values.get(part, f"[[{part}]]")
+        if isinstance(value, list):
+            out.extend(value)
+        else:
+            out.append(value)
+    return "".join(out)
+
+# st.cache_data hashes DataFrames by content
+DF_HASH_FUNCS = {pd.DataFrame: lambda d: pd.util.hash_pandas_object(d, index=True).values.tobytes()}
+
+
+@st.cache_data(max_entries=8, show_spinner=False, hash_funcs=DF_HASH_FUNCS)
+def build_table_parts(df: pd.DataFrame) -> tuple:
+    """
+    The data-dependent pieces of the widget: row markup (as pieces for the
+    final join) and the DATA JSON. Cached on the table alone, so editing the
+    title, subtitle or brand only re-stitches the template.
+    """
+    max_fan = float(df["fan_score"].max() or 1.0)
+
+    # rank order from one argsort over the int64 column; the frame itself is not re-sorted
+    order = np.argsort(df["rank"].to_numpy(np.int64), kind="stable")
+
+    # pull each column out once as an array, already in rank order; no per-row Series
+    ranks = df["rank"].to_numpy(np.int64)[order]
+    cities = df["city"].to_numpy(dtype=object, na_value="")[order]
+    fan = df["fan_score"].to_numpy(np.float64)[order]
+
+    widths = fan / max_fan * 100.0
+    # band number 1..6 per row; missing scores fall in the lowest band
+    bands = np.digitize(np.nan_to_num(fan, nan=-np.inf), FAN_BAND_EDGES) + 1
+
+    # row markup straight from the column arrays
+    row_snippets = [
+        ROW_TEMPLATE.format(
+            city=city_label,
+            rank=rank,
+            chip=flag_chip_html(city_label),
+            band=band_n,
+            width=width_pct,
+            fan=fan_v,
         )
-    data_js = "{\n" + ",\n".join(data_lines) + "\n      }"
-
-    html = (
-        HTML_TEMPLATE
-        .replace("[[ROWS]]", rows_html)
-        .replace("[[DATA]]", data_js)
-        .replace("[[TITLE]]", title)
-        .replace("[[SUBTITLE]]", subtitle)
-        .replace("[[EMBED_URL]]", embed_url)
-        .replace("[[BRAND_LOGO_URL]]", brand_logo_url)
-        .replace("[[BRAND_LOGO_ALT]]", brand_logo_alt)
-        .replace("[[BRAND_CLASS]]", brand_class or "")
+        for rank, city_label, fan_v, width_pct, band_n in zip(
+            ranks.tolist(), cities, fan.tolist(), widths.tolist(), bands.tolist()
+        )
+    ]
+    # values pre-rounded to the 2 decimals the widget displays; one entry per city,
+    # keyed by the same city labels as the rows so a blank city still matches
+    data = (
+        df[DATA_COLUMNS]
+        .take(order)
+        .assign(city=cities)
+        .drop_duplicates("city", keep="last")
+        .set_index("city")
+        .rename(columns=DATA_FIELD_NAMES)
+        .round(2)
+        .to_dict(orient="index")
     )
 
+    # rows separated by blank lines, left as pieces for the final join
+    rows_parts = ["\n\n"] * (2 * len(row_snippets) - 1) if row_snippets else []
+    rows_parts[::2] = row_snippets
+
+    # compact JSON object keyed by city; "</" escaped so a city name cannot close the <script>
+    data_js = json.dumps(data, ensure_ascii=False, separators=(",", ":")).replace("</", "<\\/")
+
+    return rows_parts, data_js
+
+
+@st.cache_data(max_entries=8, show_spinner=False, hash_funcs=DF_HASH_FUNCS)
+def generate_html_from_df(
+    df: pd.DataFrame,
+    title: str,
+    subtitle: str,
+    embed_url: str,
+    brand_logo_url: str,
+    brand_logo_alt: str,
+    brand_class: str,
+) -> str:
+    rows_parts, data_js = build_table_parts(df)
+
+    # template was split once at first use; filling it is a single join
+    html = render_html_template({
+        "ROWS": rows_parts,
+        "DATA": data_js,
+        "TITLE": title,
+        "SUBTITLE": subtitle,
+        "EMBED_URL": embed_url,
+        "BRAND_LOGO_URL": brand_logo_url,
+        "BRAND_LOGO_ALT": brand_logo_alt,
+        "BRAND_CLASS": brand_class or "",
+    })
+
     return html
 
+# --- CSV input --------------------------------------------------------
+
+try:
+    import pyarrow  # noqa: F401  (optional: multithreaded CSV parser)
+    CSV_ENGINE = "pyarrow"
+    CITY_DTYPE = "string[pyarrow]"  # contiguous Arrow buffer instead of boxed str objects
+except ImportError:
+    CSV_ENGINE = "c"
+    CITY_DTYPE = str
+
+
+def read_csv_upload(uploaded_file) -> pd.DataFrame:
+    """
+    Parse the uploaded CSV with pandas' pyarrow engine when pyarrow is installed,
+    falling back to the default parser for inputs the Arrow reader rejects.
+    """
+    if CSV_ENGINE == "pyarrow":
+        try:
+            return pd.read_csv(uploaded_file, engine="pyarrow")
+        except Exception:
+            uploaded_file.seek(0)
+    return pd.read_csv(uploaded_file)
+
+# --- Pages URL --------------------------------------------------------
+
+@functools.lru_cache(maxsize=128)
+def compute_expected_embed_url(user: str, repo: str, fname: str) -> str:
+    if user and repo.strip():
+        return f"https://{user}.github.io/{repo.strip()}/{fname}"
+    return "https://example.github.io/your-repo/widget.html"
+
 # === 3. Streamlit App ================================================
 
 st.set_page_config(page_title="Women's Stadium Fan Experience Table Generator", layout="wide")
@@ -997,7 +1320,7 @@ uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
 if uploaded_file is not None:
     # --- Step 1: read & clean CSV ---
     try:
-        raw_df = pd.read_csv(uploaded_file)
+        raw_df = read_csv_upload(uploaded_file)
     except Exception as e:
         st.error(f"Error reading CSV: {e}")
         st.stop()
@@ -1015,19 +1338,25 @@ if uploaded_file is not None:
         st.error(f"Missing required columns in CSV: {missing}")
         st.stop()
 
-    df = pd.DataFrame()
-    df["rank"] = raw_df["Rank"].astype(int)
-    df["city"] = raw_df["City"].astype(str)
-    df["crime_index"] = raw_df["City Crime Index"].astype(float)
-    df["walk_score"] = raw_df["Stadium Walk Score"].astype(float)
-    df["sentiment_pct"] = (
-        raw_df["Stadium Sentiment (%)"]
-        .astype(str)
-        .str.replace("%", "", regex=False)
-        .str.strip()
-        .astype(float)
+    # one typed frame from the CSV columns, in generator column names
+    df = (
+        raw_df[required_cols]
+        .rename(columns={
+            "Rank": "rank",
+            "City": "city",
+            "City Crime Index": "crime_index",
+            "Stadium Walk Score": "walk_score",
+            "Stadium Sentiment (%)": "sentiment_pct",
+            "Fan Experience Score": "fan_score",
+        })
+        # "45.5%" -> 45.5 in one string pass; unparseable cells become NaN
+        .assign(sentiment_pct=lambda d: pd.to_numeric(
+            d["sentiment_pct"].astype(str).str.rstrip("% \t"), errors="coerce"
+        ))
+        .astype({
+            "rank": int, "city": CITY_DTYPE, "crime_index": float, "walk_score": float, "fan_score": float,
+        })
     )
-    df["fan_score"] = raw_df["Fan Experience Score"].astype(float)
 
     # Defaults for widget text
     default_title = "Ranking 50 U.S. Cities for Women's Stadium Fan Experience"
@@ -1066,11 +1395,6 @@ if uploaded_file is not None:
     base_filename = "stadium_fan_experience.html"
     widget_file_name = st.session_state.get("widget_file_name", base_filename)
 
-    def compute_expected_embed_url(user: str, repo: str, fname: str) -> str:
-        if user and repo.strip():
-            return f"https://{user}.github.io/{repo.strip()}/{fname}"
-        return "https://example.github.io/your-repo/widget.html"
-
     expected_embed_url = compute_expected_embed_url(
         effective_github_user, repo_name, widget_file_name
     )
@@ -1106,26 +1430,22 @@ if uploaded_file is not None:
         with col_check:
             if st.button("Page availability check"):
                 try:
-                    repo_exists = check_repo_exists(
+                    # repo lookup and root listing run concurrently
+                    pre = preflight(
                         effective_github_user,
                         repo_name.strip(),
                         GITHUB_TOKEN,
                     )
-                    file_exists = False
+                    repo_exists = pre["repo_exists"]
+                    file_exists = repo_exists and base_filename in pre["names"]
                     next_fname = None
-                    if repo_exists:
-                        file_exists = check_file_exists(
+                    if file_exists:
+                        next_fname = find_next_widget_filename(
                             effective_github_user,
                             repo_name.strip(),
                             GITHUB_TOKEN,
-                            base_filename,
+                            items=pre["items"],
                         )
-                        if file_exists:
-                            next_fname = find_next_widget_filename(
-                                effective_github_user,
-                                repo_name.strip(),
-                                GITHUB_TOKEN,
-                            )
 
                     st.session_state["availability"] = {
                         "repo_exists": repo_exists,
@@ -1135,6 +1455,8 @@ if uploaded_file is not None:
                     }
                     st.session_state.setdefault("widget_file_name", base_filename)
 
+                except RateLimitError as e:
+                    st.warning(f"GitHub rate limit reached. Try again in about {e.wait} seconds.")
                 except Exception as e:
                     st.error(f"Availability check failed: {e}")
 
@@ -1145,10 +1467,6 @@ if uploaded_file is not None:
                     progress_placeholder = st.empty()
                     progress = progress_placeholder.progress(0)
 
-                    for pct in (20, 45, 70):
-                        time.sleep(0.12)
-                        progress.progress(pct)
-
                     title_for_publish = st.session_state.get("widget_title", default_title)
                     subtitle_for_publish = st.session_state.get("widget_subtitle", default_subtitle)
                     brand_for_publish = st.session_state.get("brand", brand)
@@ -1159,6 +1477,7 @@ if uploaded_file is not None:
                         effective_github_user, repo_name, widget_file_name
                     )
 
+                    # same inputs as the preview -> st.cache_data hit, no re-render
                     html_final = generate_html_from_df(
                         df,
                         title_for_publish,
@@ -1171,42 +1490,62 @@ if uploaded_file is not None:
 
                     progress.progress(80)
 
-                    ensure_repo_exists(
+                    token_key = token_cache_key(GITHUB_TOKEN)
+                    cached_ensure_repo_exists(
                         effective_github_user,
                         repo_name.strip(),
+                        token_key,
                         GITHUB_TOKEN,
                     )
 
                     progress.progress(90)
 
-                    try:
-                        ensure_pages_enabled(
+                    # Pages never switches back off, so once this session has seen it
+                    # enabled for the repo the /pages probe is skipped entirely.
+                    pages_known = st.session_state.setdefault("_pages_enabled", set())
+                    pages_key = (effective_github_user, repo_name.strip())
+
+                    # Pages setup and the file upload are independent once the repo
+                    # exists: enable Pages on a worker while the upload (which needs
+                    # session_state) runs on the script thread.
+                    with ThreadPoolExecutor(max_workers=1) as pool:
+                        pages_future = None
+                        if pages_key not in pages_known:
+                            pages_future = pool.submit(
+                                cached_ensure_pages_enabled,
+                                effective_github_user,
+                                repo_name.strip(),
+                                token_key,
+                                GITHUB_TOKEN,
+                                branch="main",
+                            )
+
+                        uploaded = upload_file_to_github(
                             effective_github_user,
                             repo_name.strip(),
                             GITHUB_TOKEN,
+                            widget_file_name,
+                            html_final,
+                            f"Add/update {widget_file_name} from Streamlit app",
                             branch="main",
                         )
-                    except Exception:
-                        pass  # soft failure
 
-                    upload_file_to_github(
-                        effective_github_user,
-                        repo_name.strip(),
-                        GITHUB_TOKEN,
-                        widget_file_name,
-                        html_final,
-                        f"Add/update {widget_file_name} from Streamlit app",
-                        branch="main",
-                    )
+                        if pages_future is not None:
+                            try:
+                                if pages_future.result():
+                                    pages_known.add(pages_key)
+                            except Exception:
+                                pass  # soft failure
 
-                    trigger_pages_build(
-                        effective_github_user,
-                        repo_name.strip(),
-                        GITHUB_TOKEN,
-                    )
+                    if uploaded:
+                        trigger_pages_build(
+                            effective_github_user,
+                            repo_name.strip(),
+                            GITHUB_TOKEN,
+                        )
+                        clear_probe_caches()  # the listing now includes the new file
 
                     progress.progress(100)
-                    time.sleep(0.15)
                     progress_placeholder.empty()
 
                     iframe_snippet = f"""<iframe src="{expected_embed_url}"
@@ -1218,8 +1557,14 @@ if uploaded_file is not None:
                     st.session_state["iframe_snippet"] = iframe_snippet
                     st.session_state["has_generated"] = True
 
-                    st.success("Widget iframe updated. Open the tabs below to preview and embed it.")
+                    if uploaded:
+                        st.success("Widget iframe updated. Open the tabs below to preview and embed it.")
+                    else:
+                        st.info("The published widget already matches this table; nothing to upload.")
 
+                except RateLimitError as e:
+                    progress_placeholder.empty()
+                    st.warning(f"GitHub rate limit reached. Try again in about {e.wait} seconds.")
                 except Exception as e:
                     progress_placeholder.empty()
                     st.error(f"GitHub publish failed: {e}")
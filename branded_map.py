@@ -1,10 +1,17 @@
 import base64
+import functools
+import hashlib
 import time
 import re
 import html as html_mod
+import types
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import streamlit as st
 import streamlit.components.v1 as components
@@ -26,6 +33,25 @@ GITHUB_USER_DEFAULT = get_secret("GITHUB_USER", "")
 
 # === GitHub helpers ===================================================
 
+@st.cache_resource(show_spinner=False)
+def github_session() -> requests.Session:
+    """
+    One keep-alive session for every GitHub call, shared across reruns,
+    so a publish reuses a single TLS connection to api.github.com.
+    Transient 5xx on reads are retried with a short backoff.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,  # hand the last response back to the status checks
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+
 def github_headers(token: str):
     headers = {"Accept": "application/vnd.github+json"}
     if token:
@@ -34,11 +60,43 @@ def github_headers(token: str):
     return headers
 
 
+@st.cache_resource(show_spinner=False)
+def etag_store() -> dict:
+    """(token key, url, params) -> {"data", "etag"} for conditional GETs."""
+    return {}
+
+
+def conditional_get(url: str, token: str, params: dict = None, keep=lambda body: body):
+    """
+    GET that sends If-None-Match with the last ETag seen for this URL.
+    A 304 costs no rate limit and carries no body, so the stored data is
+    returned instead. Returns (response, data); data is None unless the
+    status is 200/304. `keep` trims the JSON body down to what is stored.
+    """
+    key = (token_cache_key(token), url, tuple(sorted((params or {}).items())))
+    store = etag_store()
+    entry = store.get(key)
+    headers = github_headers(token)
+    if entry:
+        headers["If-None-Match"] = entry["etag"]
+    r = github_session().get(url, headers=headers, params=params)
+    if r.status_code == 304 and entry:
+        return r, entry["data"]
+    if r.status_code == 200:
+        data = keep(r.json())
+        etag = r.headers.get("ETag")
+        if etag:
+            store[key] = {"data": data, "etag": etag}
+        return r, data
+    store.pop(key, None)
+    return r, None
+
+
 def ensure_repo_exists(owner: str, repo: str, token: str) -> bool:
     api_base = "https://api.github.com"
     headers = github_headers(token)
 
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}", headers=headers)
+    r = github_session().get(f"{api_base}/repos/{owner}/{repo}", headers=headers)
     if r.status_code == 200:
         return False
     if r.status_code != 404:
@@ -50,7 +108,7 @@ def ensure_repo_exists(owner: str, repo: str, token: str) -> bool:
         "private": False,
         "description": "Branded interactive map + tables widget (auto-created by Streamlit app).",
     }
-    r = requests.post(f"{api_base}/user/repos", headers=headers, json=payload)
+    r = github_session().post(f"{api_base}/user/repos", headers=headers, json=payload)
     if r.status_code not in (200, 201):
         raise RuntimeError(f"Error creating repo: {r.status_code} {r.text}")
 
@@ -61,7 +119,7 @@ def ensure_pages_enabled(owner: str, repo: str, token: str, branch: str = "main"
     api_base = "https://api.github.com"
     headers = github_headers(token)
 
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}/pages", headers=headers)
+    r = github_session().get(f"{api_base}/repos/{owner}/{repo}/pages", headers=headers)
     if r.status_code == 200:
         return
     if r.status_code not in (404, 403):
@@ -70,7 +128,7 @@ def ensure_pages_enabled(owner: str, repo: str, token: str, branch: str = "main"
         return
 
     payload = {"source": {"branch": branch, "path": "/"}}
-    r = requests.post(f"{api_base}/repos/{owner}/{repo}/pages", headers=headers, json=payload)
+    r = github_session().post(f"{api_base}/repos/{owner}/{repo}/pages", headers=headers, json=payload)
     if r.status_code not in (201, 202):
         raise RuntimeError(f"Error enabling GitHub Pages: {r.status_code} {r.text}")
 
@@ -89,7 +147,7 @@ def upload_file_to_github(
 
     get_url = f"{api_base}/repos/{owner}/{repo}/contents/{path}"
     params = {"ref": branch}
-    r = requests.get(get_url, headers=headers, params=params)
+    r = github_session().get(get_url, headers=headers, params=params)
     sha = None
     if r.status_code == 200:
         sha = r.json().get("sha")
@@ -102,7 +160,7 @@ def upload_file_to_github(
     if sha:
         payload["sha"] = sha
 
-    r = requests.put(get_url, headers=headers, json=payload)
+    r = github_session().put(get_url, headers=headers, json=payload)
     if r.status_code not in (200, 201):
         raise RuntimeError(f"Error uploading file: {r.status_code} {r.text}")
 
@@ -110,15 +168,14 @@ def upload_file_to_github(
 def trigger_pages_build(owner: str, repo: str, token: str) -> bool:
     api_base = "https://api.github.com"
     headers = github_headers(token)
-    r = requests.post(f"{api_base}/repos/{owner}/{repo}/pages/builds", headers=headers)
+    r = github_session().post(f"{api_base}/repos/{owner}/{repo}/pages/builds", headers=headers)
     return r.status_code in (201, 202)
 
 
 def check_repo_exists(owner: str, repo: str, token: str) -> bool:
     api_base = "https://api.github.com"
-    headers = github_headers(token)
-    r = requests.get(f"{api_base}/repos/{owner}/{repo}", headers=headers)
-    if r.status_code == 200:
+    r, found = conditional_get(f"{api_base}/repos/{owner}/{repo}", token, keep=lambda body: True)
+    if found:
         return True
     if r.status_code == 404:
         return False
@@ -127,50 +184,52 @@ def check_repo_exists(owner: str, repo: str, token: str) -> bool:
 
 def check_file_exists(owner: str, repo: str, token: str, path: str, branch: str = "main") -> bool:
     api_base = "https://api.github.com"
-    headers = github_headers(token)
-    r = requests.get(
+    r, found = conditional_get(
         f"{api_base}/repos/{owner}/{repo}/contents/{path}",
-        headers=headers,
+        token,
         params={"ref": branch},
+        keep=lambda body: True,  # the file body itself is never needed here
     )
-    if r.status_code == 200:
+    if found:
         return True
     if r.status_code == 404:
         return False
     raise RuntimeError(f"Error checking file: {r.status_code} {r.text}")
 
 
-def find_next_widget_filename(owner: str, repo: str, token: str, branch: str = "main") -> str:
-    api_base = "https://api.github.com"
-    headers = github_headers(token)
-    r = requests.get(
-        f"{api_base}/repos/{owner}/{repo}/contents",
-        headers=headers,
-        params={"ref": branch},
-    )
-    if r.status_code != 200:
-        return "t1.html"
+# --- Cached probes ----------------------------------------------------
+# Existence answers are stable for minutes, so repeated publishes reuse them.
+# The cache key carries a short token hash; the token itself is passed as an
+# underscore argument, which st.cache_data does not hash or store.
 
-    max_n = 0
-    try:
-        items = r.json()
-        for item in items:
-            if item.get("type") == "file":
-                name = item.get("name", "")
-                m = re.fullmatch(r"t(\d+)\.html", name)
-                if m:
-                    max_n = max(max_n, int(m.group(1)))
-    except Exception:
-        return "t1.html"
+def token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
 
-    return f"t{max_n + 1}.html" if max_n >= 0 else "t1.html"
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_repo_exists(owner: str, repo: str, token_key: str, _token: str) -> bool:
+    return check_repo_exists(owner, repo, _token)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_file_exists(
+    owner: str, repo: str, token_key: str, _token: str, path: str, branch: str = "main"
+) -> bool:
+    return check_file_exists(owner, repo, _token, path, branch)
+
+
+def clear_probe_caches() -> None:
+    cached_repo_exists.clear()
+    cached_file_exists.clear()
 
 
 # === Brand metadata ===================================================
 
 UNBRANDED_SCALE = ["#60A5FA", "#F97316", "#DC2626"]
 
-def get_brand_meta(brand: str, style_mode: str = "Branded") -> dict:
+@functools.lru_cache(maxsize=8)
+def get_brand_meta(brand: str, style_mode: str = "Branded") -> types.MappingProxyType:
+    """Brand styling for the widget; cached per (brand, style), so read-only."""
     brand_clean = (brand or "").strip() or "Action Network"
     style_mode = (style_mode or "Branded").strip().lower()
 
@@ -243,7 +302,7 @@ def get_brand_meta(brand: str, style_mode: str = "Branded") -> dict:
     else:
         meta["map_scale"] = meta["branded_scale"]
 
-    return meta
+    return types.MappingProxyType(meta)
 
 
 # === State mapping ====================================================
@@ -261,16 +320,15 @@ STATE_ABBR = {
     "Virginia": "VA", "Washington": "WA", "West Virginia": "WV", "Wisconsin": "WI", "Wyoming": "WY",
 }
 
+# keyed by lower-cased full name and code; callers lower-case before lookup
 STATE_LOOKUP = {}
 for name, code in STATE_ABBR.items():
-    STATE_LOOKUP[name] = code
-    STATE_LOOKUP[name.title()] = code
-    STATE_LOOKUP[name.upper()] = code
     STATE_LOOKUP[name.lower()] = code
-    STATE_LOOKUP[code] = code
-    STATE_LOOKUP[code.upper()] = code
     STATE_LOOKUP[code.lower()] = code
 
+# percent signs and thousands separators dropped before numeric coercion
+VALUE_STRIP_TABLE = str.maketrans("", "", "%,")
+
 # ---- Label support (optional, desktop only) --------------------------
 
 SMALL_STATE_CENTROIDS = {
@@ -729,6 +787,19 @@ HTML_TEMPLATE_MAP_TABLE = r"""<!doctype html>
 </html>
 """
 
+# Split once at import into alternating literal segments and [[TOKEN]] names
+# (odd indices), so filling the template is a single join.
+TEMPLATE_TOKEN_RE = re.compile(r"\[\[([A-Z_]+)\]\]")
+HTML_TEMPLATE_PARTS = tuple(TEMPLATE_TOKEN_RE.split(HTML_TEMPLATE_MAP_TABLE))
+
+
+def render_map_template(values: dict) -> str:
+    out = list(HTML_TEMPLATE_PARTS)
+    for i in range(1, len(out), 2):
+        out[i] = values.get(out[i], f"[[{out[i]}]]")
+    return "".join(out)
+
+
 # === 3. HTML generators ===============================================
 
 def build_ranked_table_html(df: pd.DataFrame, value_col: str, top_n: int = 10) -> str:
@@ -746,21 +817,23 @@ def build_ranked_table_html(df: pd.DataFrame, value_col: str, top_n: int = 10) -
         head_cells.append(f'<th scope="col">{html_mod.escape(str(c))}</th>')
     thead_html = "<tr>" + "".join(head_cells) + "</tr>"
 
-    body_rows = []
-    for idx, (_, row) in enumerate(df.head(top_n).iterrows(), start=1):
-        tds = [f'<td><span class="vi-rank-pill">{idx}</span></td>']
-        tds.append(f'<td>{html_mod.escape(str(row[state_col]))}</td>')
-        for c in metric_cols:
-            val = row[c]
-            text = "" if pd.isna(val) else str(val)
-            tds.append(f'<td>{html_mod.escape(text)}</td>')
-        body_rows.append("<tr>" + "".join(tds) + "</tr>")
+    # plain tuples instead of iterrows' per-row Series; one list joined at the end
+    metric_idx = [cols.index(c) for c in metric_cols]
+    body_parts = []
+    append = body_parts.append
+    for idx, row in enumerate(df.head(top_n).itertuples(index=False, name=None), start=1):
+        append(f'<tr><td><span class="vi-rank-pill">{idx}</span></td>')
+        append(f'<td>{html_mod.escape(str(row[0]))}</td>')
+        for ci in metric_idx:
+            val = row[ci]
+            append("<td></td>" if pd.isna(val) else f"<td>{html_mod.escape(str(val))}</td>")
+        append("</tr>")
 
     return f"""
 <div class="vi-table-scroll">
 <table class="vi-map-table">
   <thead>{thead_html}</thead>
-  <tbody>{''.join(body_rows)}</tbody>
+  <tbody>{''.join(body_parts)}</tbody>
 </table>
 </div>
 """
@@ -787,22 +860,12 @@ def generate_map_table_html_from_df(
 ) -> str:
     df = df.copy()
     df[state_col] = df[state_col].astype(str).str.strip()
+    df["state_abbr"] = df[state_col].str.lower().map(STATE_LOOKUP)
 
-    s = df[state_col].astype(str).str.strip()
-    name_mask = s.str.len() > 2
-    code_mask = ~name_mask
-    s_norm = s.copy()
-    s_norm.loc[name_mask] = s_norm.loc[name_mask].str.title()
-    s_norm.loc[code_mask] = s_norm.loc[code_mask].str.upper()
-    df["state_abbr"] = s_norm.map(STATE_LOOKUP)
-
-    df[value_col] = (
-        df[value_col]
-        .astype(str)
-        .str.replace("%", "", regex=False)
-        .str.replace(",", "", regex=False)
+    df[value_col] = pd.to_numeric(
+        df[value_col].astype(str).str.translate(VALUE_STRIP_TABLE),
+        errors="coerce",
     )
-    df[value_col] = pd.to_numeric(df[value_col], errors="coerce")
 
     df = df[~df["state_abbr"].isna()].copy()
     df = df[~df[value_col].isna()].copy()
@@ -1021,45 +1084,48 @@ def generate_map_table_html_from_df(
         table_cols = [value_col] + [c for c in table_cols if c != value_col]
 
     df_for_tables = pd.DataFrame({state_col: df[state_col], **{c: df[c] for c in table_cols}})
-    df_high = df_for_tables.sort_values(by=value_col, ascending=False)
-    df_low = df_for_tables.sort_values(by=value_col, ascending=True)
+    # each table shows ten rows: partition those out and sort only them
+    vals = df_for_tables[value_col].to_numpy(dtype=float)
+    k = min(10, len(vals))
+    high_idx = np.argpartition(-vals, k - 1)[:k]
+    high_idx = high_idx[np.argsort(-vals[high_idx], kind="stable")]
+    low_idx = np.argpartition(vals, k - 1)[:k]
+    low_idx = low_idx[np.argsort(vals[low_idx], kind="stable")]
 
-    high_table_html = build_ranked_table_html(df_high, value_col=value_col, top_n=10)
-    low_table_html = build_ranked_table_html(df_low, value_col=value_col, top_n=10)
+    high_table_html = build_ranked_table_html(df_for_tables.iloc[high_idx], value_col=value_col, top_n=k)
+    low_table_html = build_ranked_table_html(df_for_tables.iloc[low_idx], value_col=value_col, top_n=k)
 
     scale_start, scale_mid, scale_end = map_scale[0], map_scale[1], map_scale[2]
 
     show_labels_str = "true" if bool(show_state_labels) else "false"
 
-    html = (
-        HTML_TEMPLATE_MAP_TABLE
-        .replace("[[PAGE_TITLE]]", html_mod.escape(page_title))
-        .replace("[[SUBTITLE]]", html_mod.escape(subtitle or ""))
-        .replace("[[STRAPLINE]]", html_mod.escape(strapline or ""))
-        .replace("[[LEGEND_LOW]]", html_mod.escape(legend_low or "Lowest"))
-        .replace("[[LEGEND_HIGH]]", html_mod.escape(legend_high or "Highest"))
-        .replace("[[MAP_HTML]]", map_html)
-        .replace("[[HIGH_TITLE]]", html_mod.escape(high_title))
-        .replace("[[HIGH_SUB]]", html_mod.escape(high_sub or ""))
-        .replace("[[LOW_TITLE]]", html_mod.escape(low_title))
-        .replace("[[LOW_SUB]]", html_mod.escape(low_sub or ""))
-        .replace("[[TABLE_HIGH_HTML]]", high_table_html)
-        .replace("[[TABLE_LOW_HTML]]", low_table_html)
-        .replace("[[BRAND_CLASS]]", brand_meta.get("brand_class", ""))
-        .replace("[[ACCENT]]", brand_meta.get("accent", "#16A34A"))
-        .replace("[[ACCENT_SOFT]]", brand_meta.get("accent_soft", "#DCFCE7"))
-        .replace("[[ACCENT_SOFTER]]", brand_meta.get("accent_softer", "#F3FBF7"))
-        .replace("[[SCALE_START]]", scale_start)
-        .replace("[[SCALE_MID]]", scale_mid)
-        .replace("[[SCALE_END]]", scale_end)
-        .replace("[[BRAND_LOGO_URL]]", brand_meta.get("logo_url", ""))
-        .replace("[[BRAND_LOGO_ALT]]", html_mod.escape(brand_meta.get("logo_alt", "")))
-        .replace("[[BRAND_URL]]", html_mod.escape(brand_meta.get("site_url", "")))
-        .replace("[[BRAND_LOGO_WIDTH]]", str(brand_meta.get("logo_width", 140)))
-        .replace("[[BRAND_LOGO_HEIGHT]]", str(brand_meta.get("logo_height", 32)))
-        .replace("[[SHOW_LABELS]]", show_labels_str)
-    )
-    return html
+    return render_map_template({
+        "PAGE_TITLE": html_mod.escape(page_title),
+        "SUBTITLE": html_mod.escape(subtitle or ""),
+        "STRAPLINE": html_mod.escape(strapline or ""),
+        "LEGEND_LOW": html_mod.escape(legend_low or "Lowest"),
+        "LEGEND_HIGH": html_mod.escape(legend_high or "Highest"),
+        "MAP_HTML": map_html,
+        "HIGH_TITLE": html_mod.escape(high_title),
+        "HIGH_SUB": html_mod.escape(high_sub or ""),
+        "LOW_TITLE": html_mod.escape(low_title),
+        "LOW_SUB": html_mod.escape(low_sub or ""),
+        "TABLE_HIGH_HTML": high_table_html,
+        "TABLE_LOW_HTML": low_table_html,
+        "BRAND_CLASS": brand_meta.get("brand_class", ""),
+        "ACCENT": brand_meta.get("accent", "#16A34A"),
+        "ACCENT_SOFT": brand_meta.get("accent_soft", "#DCFCE7"),
+        "ACCENT_SOFTER": brand_meta.get("accent_softer", "#F3FBF7"),
+        "SCALE_START": scale_start,
+        "SCALE_MID": scale_mid,
+        "SCALE_END": scale_end,
+        "BRAND_LOGO_URL": brand_meta.get("logo_url", ""),
+        "BRAND_LOGO_ALT": html_mod.escape(brand_meta.get("logo_alt", "")),
+        "BRAND_URL": html_mod.escape(brand_meta.get("site_url", "")),
+        "BRAND_LOGO_WIDTH": str(brand_meta.get("logo_width", 140)),
+        "BRAND_LOGO_HEIGHT": str(brand_meta.get("logo_height", 32)),
+        "SHOW_LABELS": show_labels_str,
+    })
 
 
 # =====================================================================
@@ -1434,6 +1500,12 @@ with left:
             help="If unchecked and the file exists, you must change the file name.",
         )
 
+        refresh_status = st.checkbox(
+            "Re-check GitHub (ignore the cached repo/file status)",
+            value=False,
+            disabled=iframe_disabled,
+        )
+
         publish_clicked = st.button(
             "Get the iframe (publish to GitHub Pages)",
             type="primary",
@@ -1445,10 +1517,28 @@ with left:
                 st.error("Please provide GitHub username, repo name, and file name.")
             else:
                 try:
-                    repo_exists = check_repo_exists(gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN)
-                    file_exists = False
-                    if repo_exists:
-                        file_exists = check_file_exists(gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN, gh_file.strip())
+                    if refresh_status:
+                        clear_probe_caches()
+                    token_key = token_cache_key(GITHUB_TOKEN)
+
+                    # both lookups are independent (a missing repo's contents are a 404 too)
+                    with ThreadPoolExecutor(max_workers=2) as pool:
+                        repo_future = pool.submit(
+                            cached_repo_exists, gh_user.strip(), gh_repo.strip(), token_key, GITHUB_TOKEN
+                        )
+                        if replace_existing:
+                            file_future = pool.submit(
+                                cached_file_exists, gh_user.strip(), gh_repo.strip(), token_key, GITHUB_TOKEN,
+                                gh_file.strip(),
+                            )
+                        else:
+                            # this answer guards against an overwrite, so skip the TTL cache;
+                            # the ETag keeps the repeat check cheap
+                            file_future = pool.submit(
+                                check_file_exists, gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN, gh_file.strip()
+                            )
+                        repo_exists = repo_future.result()
+                        file_exists = repo_exists and file_future.result()
 
                     if file_exists and not replace_existing:
                         st.error(
@@ -1456,25 +1546,32 @@ with left:
                             "Choose a different file name, or enable **Replace existing file**."
                         )
                     else:
-                        ensure_repo_exists(gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN)
-
-                        try:
-                            ensure_pages_enabled(gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN, branch="main")
-                        except Exception:
-                            pass
+                        if not repo_exists:
+                            ensure_repo_exists(gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN)
 
                         html_to_publish = st.session_state.get("generated_html", "")
-                        upload_file_to_github(
-                            owner=gh_user.strip(),
-                            repo=gh_repo.strip(),
-                            token=GITHUB_TOKEN,
-                            path=gh_file.strip(),
-                            content=html_to_publish,
-                            message=f"Publish {gh_file.strip()} from Branded Map app",
-                            branch="main",
-                        )
+
+                        # Pages setup runs on a worker while the file is uploaded
+                        with ThreadPoolExecutor(max_workers=1) as pool:
+                            pages_future = pool.submit(
+                                ensure_pages_enabled, gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN, branch="main"
+                            )
+                            upload_file_to_github(
+                                owner=gh_user.strip(),
+                                repo=gh_repo.strip(),
+                                token=GITHUB_TOKEN,
+                                path=gh_file.strip(),
+                                content=html_to_publish,
+                                message=f"Publish {gh_file.strip()} from Branded Map app",
+                                branch="main",
+                            )
+                            try:
+                                pages_future.result()
+                            except Exception:
+                                pass
 
                         trigger_pages_build(gh_user.strip(), gh_repo.strip(), GITHUB_TOKEN)
+                        clear_probe_caches()  # repo and file exist now
 
                         published_url = compute_expected_embed_url(gh_user.strip(), gh_repo.strip(), gh_file.strip())
                         iframe_snippet = dedent(f"""\